@@ -1,13 +1,29 @@
+import os
+import logging
+import tracemalloc
 import streamlit as st
 import pandas as pd
 import altair as alt
-from data_loader import load_initial_data, load_fundamentus_data
+from data_loader import (
+    load_initial_data, dataset_version, load_valuation_snapshot, load_cached_valuation, start_valuation_refresher,
+    valuation_snapshot_version,
+    compute_latest_snapshot, partition_by_ticker, institution_names, load_artifact, current_artifact_version,
+    artifact_manifest, load_artifact_snapshot, load_artifact_partition, CACHE_DIR_NAME, VALUATION_TTL_SECONDS, INSTITUTION_KEY_PREFIX,
+    STAGE_LOG, etl_logger, set_memory_tracing
+)
 
 # Page Config
 st.set_page_config(page_title="Banking Dashboard", layout="wide")
 
 # Constants
-DATA_DIR = r'c:\D\Python\Balancetes\historical'
+DATA_DIR = os.environ.get('BALANCETES_DATA_DIR', r'c:\D\Python\Balancetes\historical')
+# Parsed CSVs, snapshots and the valuation cache live next to the monthly CSVs
+CACHE_DIR = os.path.join(os.path.dirname(DATA_DIR), CACHE_DIR_NAME)
+
+# ETL stage timings as JSON lines on the server console
+if not etl_logger.handlers:
+    etl_logger.addHandler(logging.StreamHandler())
+    etl_logger.setLevel(logging.INFO)
 
 BANK_NAMES = {
     'BAZA': 'BAZA3 - BCO DA AMAZONIA S.A.',
@@ -27,89 +43,110 @@ BANK_NAMES = {
     'BPAN': 'BPAN4 - BANCO PAN'
 }
 
-@st.cache_data
-def get_data():
-    df = load_initial_data(DATA_DIR)
-    
-    # Load Valuation Data from Fundamentus (Live)
-    val_df = load_fundamentus_data()
-    
-    return df, val_df
-
-def main():
-    # Custom CSS to reduce metric font size
-    st.markdown("""
-    <style>
-    div[data-testid="stMetricValue"] {
-        font_size: 16px !important;
-    }
-    div[data-testid="stMetricLabel"] {
-        font_size: 14px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    st.title("Banking Financial Dashboard")
+# --- Cache layers ---
+# Historical: keyed by the published artifact version (precompute.py), else by the content version
+# of the workbook + monthly CSVs (see dataset_version)
+# Market: keyed by time, fed by the background quote refresher
+
+@st.cache_data(show_spinner="Loading historical data...")
+def get_data(version, full_universe=False):
+    # Precomputed artifact (memory-mapped, no raw file parsing) when precompute.py published one
+    artifact = load_artifact(CACHE_DIR, full_universe, version)
+    if artifact is not None:
+        return artifact[0], artifact[1]
+
+    # Fallback: in-process ETL. full_universe: every institution in the monthly CSVs
+    df = load_initial_data(DATA_DIR, full_universe=full_universe)
+    
+    # Latest-snapshot table shared by Overview and Valuation (computed once per dataset version)
+    snapshot_df = compute_latest_snapshot(df)
+    
+    return df, snapshot_df
+
+@st.cache_resource
+def get_bank_partitions(version, full_universe=False):
+    # Per-ticker partitions of the cached dataset, shared across reruns without copying.
+    # Readers must copy a partition before modifying it.
+    df = get_data(version, full_universe)[0]
+    return partition_by_ticker(df)
+
+# Lazy per-view providers: each view asks only for the slice it renders. With a published
+# artifact none of them touches the full dataset; without one they fall back to get_data.
+
+@st.cache_data(show_spinner=False)
+def get_tickers(version, full_universe=False):
+    # Ticker list from the artifact manifest (no data read), else from the snapshot
+    manifest = artifact_manifest(CACHE_DIR, full_universe, version)
+    if manifest and 'partitions' in manifest:
+        return sorted(manifest['partitions'])
+    return sorted(get_snapshot(version, full_universe)['Ticker'])
+
+@st.cache_data(show_spinner="Loading snapshot...")
+def get_snapshot(version, full_universe=False):
+    # Overview and Valuation: the latest-snapshot table only
+    snapshot_df = load_artifact_snapshot(CACHE_DIR, full_universe, version)
+    if snapshot_df is None:
+        snapshot_df = get_data(version, full_universe)[1]
+    return snapshot_df
+
+@st.cache_data(show_spinner="Loading bank history...")
+def get_bank_partition(version, full_universe, ticker):
+    # Bank Details: one ticker's rows (a single row range of the memory-mapped artifact)
+    bank_df = load_artifact_partition(CACHE_DIR, ticker, full_universe, version)
+    if bank_df is None:
+        bank_df = get_bank_partitions(version, full_universe).get(ticker)
+    return bank_df
 
-    df = get_data()
-
-    if df.empty:
-        st.error(f"No data found in {DATA_DIR}. Please ensure files are present.")
-        return
-
-    # Sidebar
-    st.sidebar.header("Settings")
-    
-    
-    if st.sidebar.button("Clear Cache"):
-        st.cache_data.clear()
-        st.rerun()
+@st.cache_data
+def get_chart_payloads(version, full_universe, ticker):
+    # Trimmed, rescaled chart datasets per bank, built once per dataset version
+    bank_df = get_bank_partition(version, full_universe, ticker)
+    if bank_df is None or bank_df.empty:
+        return None
+    return build_chart_payloads(bank_df)
 
-def render_general_overview(df):
+@st.cache_data
+def get_bank_names(version, full_universe=False):
+    # Display names by ticker; in full-universe mode unlisted institutions come from the artifact
+    # manifest, or from the latest CSV when no artifact is published
+    names = {}
+    if full_universe:
+        manifest = artifact_manifest(CACHE_DIR, full_universe, version)
+        names.update(manifest['institution_names'] if manifest else institution_names(os.path.dirname(DATA_DIR)))
+    names.update(BANK_NAMES)
+    return names
+
+@st.cache_resource
+def get_valuation_refresher():
+    # One background thread per server process refreshes Fundamentus quotes on a schedule
+    return start_valuation_refresher(CACHE_DIR)
+
+@st.cache_data(ttl=60)
+def get_valuation_data(snapshot_version):
+    # Last good quotes on disk (never blocks on HTTP), keyed by the snapshot's version so new
+    # quotes (or the first ones after a cold start) show on the next rerun; the TTL only
+    # refreshes the stale flag, raised after a missed refresh cycle
+    return load_valuation_snapshot(CACHE_DIR, ttl_seconds=2 * VALUATION_TTL_SECONDS)
+
+def render_general_overview(snapshot_df, bank_names=BANK_NAMES):
     st.subheader("General Overview - Key Performance Indicators")
     
-    # Get unique tickers
-    tickers = sorted(df['Ticker'].unique())
-    summary_data = []
-
-    for ticker in tickers:
-        bank_df = df[df['Ticker'] == ticker].sort_values(by='Date').reset_index(drop=True)
-        if bank_df.empty:
-            continue
-            
-        last_row = bank_df.iloc[-1]
-        last_date = last_row['Date']
-        
-        # Calculations (Mirroring detail view logic)
-        acc_3m = bank_df[bank_df['Date'] > last_date - pd.DateOffset(months=3)]['MonthlyProfit'].sum()
-        acc_12m = bank_df[bank_df['Date'] > last_date - pd.DateOffset(months=12)]['MonthlyProfit'].sum()
-        
-        # Penultimate Profit for MoM Var
-        if len(bank_df) >= 2:
-            penult_profit = bank_df.iloc[-2]['MonthlyProfit']
-            profit_var_pct = ((last_row['MonthlyProfit'] - penult_profit) / abs(penult_profit)) if penult_profit != 0 else 0
-        else:
-            profit_var_pct = 0
-
-        # Construct URL for Ticker Link (?ticker=XYZ)
-        # We rely on Streamlit's query param handling. 
-        # Note: We use relative path "./?ticker=" to ensure it keeps current host.
-        ticker_link = f"./?ticker={ticker}"
-
-        summary_data.append({
-            "Bank": BANK_NAMES.get(ticker, ticker),
-            "Ticker": ticker_link, # This will be the URL
-            "Ref Date": last_date.strftime('%Y-%m'),
-            "LTM Profit": acc_12m / 1e6,
-            "Last 3m Profit": acc_3m / 1e6,
-            "Last Mo. Profit": last_row['MonthlyProfit'] / 1e6,
-            "MoM Var": profit_var_pct * 100,
-            "ROE": last_row['ROE'] * 100,
-            "Proj ROE 3m": last_row['ProjectedROE3m'] * 100, # Shortened name
-            "Equity": last_row['Equity'] / 1e9
-        })
-    
-    summary_df = pd.DataFrame(summary_data)
+    # One row per ticker, straight from the precomputed latest-snapshot table
+    # Construct URL for Ticker Link (?ticker=XYZ)
+    # We rely on Streamlit's query param handling. 
+    # Note: We use relative path "./?ticker=" to ensure it keeps current host.
+    summary_df = pd.DataFrame({
+        "Bank": snapshot_df['Ticker'].map(lambda t: bank_names.get(t, t)),
+        "Ticker": "./?ticker=" + snapshot_df['Ticker'], # This will be the URL
+        "Ref Date": snapshot_df['Date'].dt.strftime('%Y-%m'),
+        "LTM Profit": snapshot_df['Last12mProfit'] / 1e6,
+        "Last 3m Profit": snapshot_df['Last3mProfit'] / 1e6,
+        "Last Mo. Profit": snapshot_df['LastProfit'] / 1e6,
+        "MoM Var": snapshot_df['ProfitVarMoM'] * 100,
+        "ROE": snapshot_df['ROE'] * 100,
+        "Proj ROE 3m": snapshot_df['ProjectedROE3m'] * 100, # Shortened name
+        "Equity": snapshot_df['Equity'] / 1e9
+    })
     
     # Sorting Controls
     c_sort1, c_sort2 = st.columns([2, 1])
@@ -170,16 +207,76 @@ def render_general_overview(df):
     )
 
 
-def render_bank_details(df, selected_ticker):
-    # Filter Data
-    bank_df = df[df['Ticker'] == selected_ticker].sort_values(by='Date').reset_index(drop=True)
-
-    if bank_df.empty:
+def render_diagnostics():
+    # Optional sidebar panel with the ETL stage log of this server process
+    with st.sidebar.expander("Diagnostics"):
+        trace = st.checkbox("Trace memory (applies to the next rebuild)", value=tracemalloc.is_tracing())
+        set_memory_tracing(trace)
+
+        records = list(STAGE_LOG)
+        if not records:
+            st.caption("No ETL stages recorded in this process yet.")
+            return
+
+        log_df = pd.DataFrame(records).iloc[::-1]
+        log_df['time'] = pd.to_datetime(log_df['ts'], unit='s').dt.strftime('%H:%M:%S')
+        log_df['stage'] = log_df['depth'].map(lambda d: '  ' * int(d)) + log_df['stage']
+        cols = [c for c in ['time', 'stage', 'seconds', 'rows_in', 'rows_out', 'peak_mb', 'file'] if c in log_df.columns]
+        st.dataframe(log_df[cols], hide_index=True, use_container_width=True)
+
+
+def _scale_for(values):
+    # Display unit for a money column: billions when the largest absolute value reaches 1e9
+    max_val = values.abs().max()
+    if pd.isna(max_val) or max_val < 1e9:
+        return 1e6, "M"
+    return 1e9, "B"
+
+def build_chart_payloads(bank_df):
+    """
+    Chart datasets for one bank: {chart: (frame, y column, axis title)}.
+    Each frame holds only Date and the columns its chart encodes, already rescaled,
+    so the Vega-Lite specs embed no unused columns.
+    """
+    def payload(df, col, title_prefix):
+        scale_factor, unit = _scale_for(df[col])
+        frame = pd.DataFrame({'Date': df['Date'], f"{col}_Scaled": df[col] / scale_factor})
+        return frame, f"{col}_Scaled", f"{title_prefix} ({unit})"
+
+    charts = {}
+
+    # Monthly Profit with its SMA12 on the same scale
+    frame, col, title = payload(bank_df, 'MonthlyProfit', 'Monthly Profit')
+    scale_factor = 1e9 if 'B' in title else 1e6
+    frame['MonthlyProfit_SMA12_Scaled'] = bank_df['MonthlyProfit_SMA12'] / scale_factor
+    charts['profit'] = (frame, col, title)
+
+    # LTM profit (initial months without a full 12m window dropped) and its variation
+    df_ltm = bank_df.dropna(subset=['Accumulated12mProfit'])
+    charts['ltm'] = payload(df_ltm, 'Accumulated12mProfit', 'Accumulated 12m Profit')
+    ltm_var = pd.DataFrame({'Date': df_ltm['Date'], 'Acc12m_Var': df_ltm['Accumulated12mProfit'].diff()})
+    charts['ltm_var'] = payload(ltm_var, 'Acc12m_Var', 'Variation LTM')
+
+    # Ratios: no scaling
+    charts['roe'] = (bank_df[['Date', 'ROE']], 'ROE', 'ROE')
+    charts['proj_roe'] = (bank_df.dropna(subset=['ProjectedROE3m'])[['Date', 'ProjectedROE3m']], 'ProjectedROE3m', 'ProjectedROE3m')
+
+    charts['equity'] = payload(bank_df, 'Equity', 'Equity')
+    charts['equity_var'] = payload(bank_df, 'Equity_Var', 'Equity Variation')
+    return charts
+
+def render_bank_details(bank_df, selected_ticker, bank_names=BANK_NAMES, charts=None):
+    # Bank partition (already sorted by Date, with Profit_Var / Equity_Var precomputed).
+    # Read-only: nothing below modifies it.
+    if bank_df is None or bank_df.empty:
         st.warning("No data for selected bank.")
         return
+
+    if charts is None:
+        charts = build_chart_payloads(bank_df)
     
     with st.expander("Show Raw Data"):
-        st.write(bank_df.sort_values(by='Date', ascending=False).head(20))
+        st.write(bank_df.iloc[::-1].head(20).drop(columns=['Profit_Var', 'Equity_Var']))
 
     # Calculations for KPIs
     # Ensure enough data
@@ -205,7 +302,7 @@ def render_bank_details(df, selected_ticker):
         # Accumulated 12 Months
         acc_12m = bank_df[bank_df['Date'] > last_date - pd.DateOffset(months=12)]['MonthlyProfit'].sum()
 
-        st.subheader(f"{BANK_NAMES.get(selected_ticker, selected_ticker)}")
+        st.subheader(f"{bank_names.get(selected_ticker, selected_ticker)}")
         st.write(f"Ref: {last_date.strftime('%B %Y')}")
 
         # Last Month ROE
@@ -231,36 +328,23 @@ def render_bank_details(df, selected_ticker):
         kpi6.metric("Projected ROE (3m)", f"{last_proj_roe:.2%}")
 
     # --- CHARTS ---
-    
-    # Pre-calc Variations for Charts
-    bank_df['Profit_Var'] = bank_df['MonthlyProfit'].diff()
-    bank_df['Equity_Var'] = bank_df['Equity'].diff()
-
-    # Helper to determine scale and normalize data
-    def prepare_chart_data(df, col, title_prefix):
-        # Check max absolute value to decide scale
-        max_val = df[col].abs().max()
-        if pd.isna(max_val) or max_val == 0:
-            scale_factor = 1e6
-            unit = "M"
-        elif max_val >= 1e9:
-            scale_factor = 1e9
-            unit = "B"
-        else:
-            scale_factor = 1e6
-            unit = "M"
-            
-        scaled_col = f"{col}_Scaled"
-        df[scaled_col] = df[col] / scale_factor
-        axis_title = f"{title_prefix} ({unit})"
-        return df, scaled_col, axis_title
+
+    # Optional date range, applied to the chart datasets before they are serialized
+    first_date, last_date = bank_df['Date'].iloc[0].to_pydatetime(), bank_df['Date'].iloc[-1].to_pydatetime()
+    if first_date < last_date:
+        start_date, end_date = st.slider(
+            "Chart period", min_value=first_date, max_value=last_date,
+            value=(first_date, last_date), format="YYYY-MM", key=f"period_{selected_ticker}"
+        )
+    else:
+        start_date, end_date = first_date, last_date
+
+    def chart_data(name):
+        frame, col, title = charts[name]
+        return frame[(frame['Date'] >= start_date) & (frame['Date'] <= end_date)], col, title
 
     # 1. Monthly Profit (Bar) and SMA (Line)
-    # Scale based on MonthlyProfit
-    bank_df, col_profit_scaled, title_profit = prepare_chart_data(bank_df, 'MonthlyProfit', 'Monthly Profit')
-    # Scale SMA using same factor as Profit for consistency
-    scale_factor_profit = 1e9 if 'B' in title_profit else 1e6
-    bank_df['MonthlyProfit_SMA12_Scaled'] = bank_df['MonthlyProfit_SMA12'] / scale_factor_profit
+    df_profit, col_profit_scaled, title_profit = chart_data('profit')
 
     st.markdown("### Monthly Profit Evolution")
     st.markdown(
@@ -273,7 +357,7 @@ def render_bank_details(df, selected_ticker):
         unsafe_allow_html=True
     )
     
-    base = alt.Chart(bank_df).encode(x=alt.X('Date:T', scale=alt.Scale(nice=True)))
+    base = alt.Chart(df_profit).encode(x=alt.X('Date:T', scale=alt.Scale(nice=True)))
 
     bar_profit = base.mark_bar().encode(
         y=alt.Y(f'{col_profit_scaled}:Q', title=title_profit),
@@ -290,11 +374,7 @@ def render_bank_details(df, selected_ticker):
 
     # 1.b Accumulated 12m Profit (Line)
     st.markdown("### Accumulated 12m Profit Evolution")
-    # Filter out the initial rows where Accumulated12mProfit is NaN
-    df_ltm = bank_df.dropna(subset=['Accumulated12mProfit']).copy()
-    
-    # Scale LTM
-    df_ltm, col_ltm_scaled, title_ltm = prepare_chart_data(df_ltm, 'Accumulated12mProfit', 'Accumulated 12m Profit')
+    df_ltm, col_ltm_scaled, title_ltm = chart_data('ltm')
 
     chart_acc_profit = alt.Chart(df_ltm).mark_line(point=True, color='green').encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
@@ -304,12 +384,10 @@ def render_bank_details(df, selected_ticker):
     st.altair_chart(chart_acc_profit, use_container_width=True)
 
     # 2. Accumulated 12m Profit Variation (Bar)
-    df_ltm['Acc12m_Var'] = df_ltm['Accumulated12mProfit'].diff()
-    # Scale Variation
-    df_ltm, col_var_scaled, title_var = prepare_chart_data(df_ltm, 'Acc12m_Var', 'Variation LTM')
+    df_ltm_var, col_var_scaled, title_var = chart_data('ltm_var')
     
     st.markdown("### Accumulated 12m Profit Variation")
-    chart_profit_var = alt.Chart(df_ltm).mark_bar().encode(
+    chart_profit_var = alt.Chart(df_ltm_var).mark_bar().encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
         y=alt.Y(f'{col_var_scaled}:Q', title=title_var),
         color=alt.condition(
@@ -323,7 +401,7 @@ def render_bank_details(df, selected_ticker):
 
     # 3. ROE (Line) - No scaling needed (Percentage)
     st.markdown("### ROE Evolution")
-    chart_roe = alt.Chart(bank_df).mark_line(point=True, color='orange').encode(
+    chart_roe = alt.Chart(chart_data('roe')[0]).mark_line(point=True, color='orange').encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
         y=alt.Y('ROE:Q', axis=alt.Axis(format='%')),
         tooltip=['Date', alt.Tooltip('ROE', format='.2%')]
@@ -332,9 +410,8 @@ def render_bank_details(df, selected_ticker):
 
     # 3.b Projected ROE 3m (Line) - No scaling needed
     st.markdown("### Projected ROE (3m Annualized) Evolution")
-    df_proj = bank_df.dropna(subset=['ProjectedROE3m'])
     
-    chart_proj_roe = alt.Chart(df_proj).mark_line(point=True, color='teal').encode(
+    chart_proj_roe = alt.Chart(chart_data('proj_roe')[0]).mark_line(point=True, color='teal').encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
         y=alt.Y('ProjectedROE3m:Q', axis=alt.Axis(format='%')),
         tooltip=['Date', alt.Tooltip('ProjectedROE3m', format='.2%')]
@@ -342,12 +419,10 @@ def render_bank_details(df, selected_ticker):
     st.altair_chart(chart_proj_roe, use_container_width=True)
 
     # 4. Equity (Line)
-    scale_factor_equity = 1e6 # Default
-    # Scale Equity
-    bank_df, col_equity_scaled, title_equity = prepare_chart_data(bank_df, 'Equity', 'Equity')
+    df_equity, col_equity_scaled, title_equity = chart_data('equity')
     
     st.markdown("### Equity Evolution")
-    chart_equity = alt.Chart(bank_df).mark_line(point=True, color='purple').encode(
+    chart_equity = alt.Chart(df_equity).mark_line(point=True, color='purple').encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
         y=alt.Y(f'{col_equity_scaled}:Q', title=title_equity),
         tooltip=['Date', alt.Tooltip(f'{col_equity_scaled}:Q', title=title_equity, format=',.2f')]
@@ -355,10 +430,10 @@ def render_bank_details(df, selected_ticker):
     st.altair_chart(chart_equity, use_container_width=True)
 
     # 5. Equity Variation (Bar)
-    bank_df, col_eq_var_scaled, title_eq_var = prepare_chart_data(bank_df, 'Equity_Var', 'Equity Variation')
+    df_eq_var, col_eq_var_scaled, title_eq_var = chart_data('equity_var')
     
     st.markdown("### Equity Variation")
-    chart_equity_var = alt.Chart(bank_df).mark_bar().encode(
+    chart_equity_var = alt.Chart(df_eq_var).mark_bar().encode(
         x=alt.X('Date:T', scale=alt.Scale(nice=True)),
         y=alt.Y(f'{col_eq_var_scaled}:Q', title=title_eq_var),
         color=alt.condition(
@@ -371,40 +446,29 @@ def render_bank_details(df, selected_ticker):
     st.altair_chart(chart_equity_var, use_container_width=True)
 
 
-def render_valuation_view(df, val_df):
+def render_valuation_view(snapshot_df, val_df, val_status):
     st.subheader("Valuation & Comparative Analysis")
     
     if val_df.empty:
-        st.warning("Valuation data (multiplos.xlsx) not found or empty.")
+        st.warning("Valuation quotes (Fundamentus) are still loading or unavailable. Refresh the page in a moment.")
         return
 
-    # Prepare Data
-    # 1. Get latest financial row for each ticker
-    tickers = sorted(df['Ticker'].unique())
-    latest_data = []
-    
-    for ticker in tickers:
-        bank_df = df[df['Ticker'] == ticker].sort_values(by='Date')
-        if bank_df.empty:
-            continue
-            
-        last_row = bank_df.iloc[-1]
-        
-        # Calculate MoM Growth
-        if len(bank_df) >= 2:
-            penult_profit = bank_df.iloc[-2]['MonthlyProfit']
-            mom_growth = ((last_row['MonthlyProfit'] - penult_profit) / abs(penult_profit)) if penult_profit != 0 else 0
+    if val_status.get('fetched_at'):
+        fetched = pd.Timestamp(val_status['fetched_at'], unit='s', tz='UTC').tz_convert('America/Sao_Paulo')
+        if val_status.get('stale'):
+            st.warning(f"Quotes could not be refreshed. Showing cached quotes from {fetched:%Y-%m-%d %H:%M}.")
         else:
-            mom_growth = 0
-            
-        latest_data.append({
-            'Ticker': ticker,
-            'ROE': last_row['ROE'] * 100, # Scale to 0-100 for display
-            'Proj ROE 3m': last_row['ProjectedROE3m'] * 100,
-            'MoM Growth': mom_growth * 100
-        })
-        
-    fin_df = pd.DataFrame(latest_data)
+            st.caption(f"Quotes as of {fetched:%Y-%m-%d %H:%M}")
+
+    # Prepare Data
+    # 1. Latest financial row for each listed ticker (precomputed snapshot; CNPJ-keyed institutions have no quotes)
+    snapshot_df = snapshot_df[~snapshot_df['Ticker'].str.startswith(INSTITUTION_KEY_PREFIX)]
+    fin_df = pd.DataFrame({
+        'Ticker': snapshot_df['Ticker'],
+        'ROE': snapshot_df['ROE'] * 100, # Scale to 0-100 for display
+        'Proj ROE 3m': snapshot_df['ProjectedROE3m'] * 100,
+        'MoM Growth': snapshot_df['ProfitVarMoM'] * 100
+    })
     
     # 2. Merge with Valuation Data
     merged_df = pd.merge(fin_df, val_df, on='Ticker', how='left')
@@ -591,31 +655,56 @@ def main():
     
     st.title("Banking Financial Dashboard")
 
-    df, val_df = get_data() # Modified to receive val_df
+    # Sidebar
+    st.sidebar.header("Settings")
+
+    # Opt-in: peers from the whole balancete (unlisted institutions keyed by CNPJ root)
+    full_universe = st.sidebar.toggle("All institutions", value=False,
+                                      help="Include every institution in the monthly CSVs, not only listed banks")
 
-    if df.empty:
+    source_version = dataset_version(DATA_DIR)
+    artifact_version = current_artifact_version(CACHE_DIR, full_universe)
+    version = artifact_version or source_version
+    if artifact_version and artifact_version != source_version:
+        st.sidebar.caption("Source files changed since the last precompute run.")
+
+    # Data is requested per view below; the ticker list alone is cheap (artifact manifest)
+    available_tickers = get_tickers(version, full_universe)
+    if not available_tickers:
         st.error(f"No data found in {DATA_DIR}. Please ensure files are present.")
         return
 
+    bank_names = get_bank_names(version, full_universe) if full_universe else BANK_NAMES
+
     # Check query params for navigation
     # We use st.query_params to get 'ticker'
     query_params = st.query_params
     nav_ticker = query_params.get("ticker", None)
 
-    # Sidebar
-    st.sidebar.header("Settings")
-    
-    if st.sidebar.button("Clear Cache"):
-        st.cache_data.clear()
+    # Independent refresh actions: quotes only (one HTTP call) vs full historical rebuild
+    if st.sidebar.button("Refresh Prices"):
+        get_valuation_refresher()
+        load_cached_valuation(CACHE_DIR, ttl_seconds=0)
+        get_valuation_data.clear()
         st.rerun()
 
+    if st.sidebar.button("Rebuild History"):
+        get_data.clear()
+        get_bank_partitions.clear()
+        get_tickers.clear()
+        get_snapshot.clear()
+        get_bank_partition.clear()
+        get_bank_names.clear()
+        get_chart_payloads.clear()
+        st.rerun()
+
+    render_diagnostics()
+
     # Determine default View Mode and Ticker index
     # If nav_ticker is present, switch to 'Bank Details' and select that ticker
     default_view_index = 0 # General Overview
     default_ticker_index = 0
 
-    available_tickers = sorted(df['Ticker'].unique())
-
     if nav_ticker and nav_ticker in available_tickers:
         default_view_index = 1 # Bank Details
         try:
@@ -635,13 +724,17 @@ def main():
             "Select Bank", 
             available_tickers, 
             index=default_ticker_index,
-            format_func=lambda x: BANK_NAMES.get(x, x)
+            format_func=lambda x: bank_names.get(x, x)
         )
-        render_bank_details(df, selected_ticker)
+        render_bank_details(get_bank_partition(version, full_universe, selected_ticker), selected_ticker, bank_names,
+                            get_chart_payloads(version, full_universe, selected_ticker))
     elif view_mode == "Valuation": # Added new condition for Valuation view
-        render_valuation_view(df, val_df)
+        # Quotes are only needed here: the background refresher starts on first use
+        get_valuation_refresher()
+        val_df, val_status = get_valuation_data(valuation_snapshot_version(CACHE_DIR))
+        render_valuation_view(get_snapshot(version, full_universe), val_df, val_status)
     else:
-        render_general_overview(df)
+        render_general_overview(get_snapshot(version, full_universe), bank_names)
 
 if __name__ == "__main__":
     main()
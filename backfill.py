@@ -0,0 +1,53 @@
+"""
+Resumable bulk backfill of the monthly balancetes (*BANCOS.CSV or *BANCOS.csv.zip, back to 2015)
+into the materialized dataset that incremental loads and precompute.py --incremental reuse.
+
+Months are ingested oldest first with a checkpoint after each one, so the command can be
+interrupted and run again; it resumes after the last committed month. Months that failed and
+archives re-published since the last run are ingested again:
+
+    python backfill.py --data-dir /data/Balancetes --workers 4
+    python backfill.py --data-dir /data/Balancetes --limit 12 --publish   # next 12 months, then publish
+
+The 'historical/Balancetes_por_ticker.xlsx' workbook is optional and only seeds the history.
+Exits with status 0 when every pending month was ingested, 1 otherwise.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import data_loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the monthly balancetes with per-month checkpoints.")
+    parser.add_argument('--data-dir', required=True,
+                        help="Directory with the monthly *BANCOS.CSV / *BANCOS.csv.zip files")
+    parser.add_argument('--full-universe', action='store_true', help="Ingest every institution, not only mapped banks")
+    parser.add_argument('--workers', type=int, default=None, help="Parse archives ahead in this many processes")
+    parser.add_argument('--limit', type=int, default=None, help="Stop after this many months")
+    parser.add_argument('--publish', action='store_true', help="Publish the dashboard artifact afterwards")
+    parser.add_argument('--log-stages', action='store_true', help="Print one JSON line per ETL stage")
+    args = parser.parse_args()
+
+    if args.log_stages:
+        data_loader.etl_logger.addHandler(logging.StreamHandler(sys.stdout))
+        data_loader.etl_logger.setLevel(logging.INFO)
+
+    historical = os.path.join(args.data_dir, 'historical')
+    summary = data_loader.backfill_history(historical, workers=args.workers, full_universe=args.full_universe,
+                                           limit=args.limit)
+    if summary is None:
+        return 1
+    for name in summary['failed']:
+        print(f"Failed: {name} (retried on the next run)")
+
+    if args.publish and data_loader.build_artifact(historical, full_universe=args.full_universe,
+                                                   incremental=True) is None:
+        return 1
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Synthetic-data benchmark for the loaders and the dashboard snapshot computations.
+
+Generates a realistic data directory (monthly *BANCOS.CSV files, historical/Balancetes_por_ticker.xlsx
+and multiplos.xlsx), times each stage, and reports wall time, throughput and peak memory (tracemalloc).
+Baselines are stored as JSON so regressions show up as numbers:
+
+    python benchmark.py --months 36 --institutions 150 --save-baseline
+    python benchmark.py --months 36 --institutions 150          # compares with the saved baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+BASELINE_FILE = 'benchmark_baseline.json'
+
+CSV_COLUMNS = ['#DATA_BASE', 'DOCUMENTO', 'CNPJ', 'AGENCIA', 'NOME_INSTITUICAO', 'COD_CONGL',
+               'NOME_CONGL', 'TAXONOMIA', 'CONTA', 'NOME_CONTA', 'SALDO']
+
+
+def _format_saldo(values):
+    # pt-BR decimal comma, no thousands separator (as published by the Central Bank)
+    return pd.Series(np.round(values, 2)).map(lambda v: f"{v:.2f}".replace('.', ','))
+
+
+def generate_dataset(root_dir, months=24, excel_months=12, institutions=50, accounts=100, seed=0):
+    """
+    Writes a synthetic data directory under root_dir:
+    - historical/Balancetes_por_ticker.xlsx: one sheet per mapped ticker for the first excel_months
+    - <YYYYMM>BANCOS.CSV for every month (the first excel_months overlap with the workbook)
+    - multiplos.xlsx: Fundamentus-like valuation table
+    Institutions include the mapped banks (NAME_TO_TICKER) plus synthetic ones, up to institutions;
+    each has accounts balance lines, always including income, expense and equity.
+    Returns a dict with the generated sizes.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(root_dir, 'historical'), exist_ok=True)
+
+    names = list(data_loader.NAME_TO_TICKER.keys())[:institutions]
+    names += [f"INSTITUICAO SINTETICA {i:04d} S.A." for i in range(institutions - len(names))]
+    cnpjs = rng.integers(1_000_000, 99_999_999, size=len(names))
+
+    key_accounts = [data_loader.ACCOUNT_INCOME, data_loader.ACCOUNT_EXPENSE, data_loader.ACCOUNT_EQUITY]
+    other_accounts = sorted(set(rng.integers(1_000_000_000, 9_999_999_999, size=accounts * 2)) - set(key_accounts))
+    account_codes = np.array(key_accounts + other_accounts[:max(accounts - 3, 0)], dtype=np.int64)
+    account_names = np.array([f"CONTA {c}" for c in account_codes])
+
+    dates = pd.date_range('2015-01-01', periods=months, freq='MS')
+    equity = rng.uniform(1e8, 2e11, size=len(names))
+    monthly_profit = np.zeros((months, len(names)))
+    csv_bytes = 0
+
+    cumulative = np.zeros(len(names))
+    for m, date in enumerate(dates):
+        if date.month in (1, 7):
+            cumulative = np.zeros(len(names))
+        monthly_profit[m] = equity * rng.normal(0.012, 0.004, size=len(names))
+        cumulative = cumulative + monthly_profit[m]
+        equity = equity * (1 + rng.normal(0.004, 0.002, size=len(names)))
+
+        n_inst, n_acc = len(names), len(account_codes)
+        saldo = rng.normal(0, 1e9, size=(n_inst, n_acc))
+        income = np.abs(cumulative) * 3
+        saldo[:, 0] = income
+        saldo[:, 1] = cumulative - income
+        saldo[:, 2] = equity
+
+        frame = pd.DataFrame({
+            '#DATA_BASE': int(date.strftime('%Y%m')),
+            'DOCUMENTO': 4010,
+            'CNPJ': np.repeat(cnpjs, n_acc),
+            'AGENCIA': '',
+            'NOME_INSTITUICAO': np.repeat(names, n_acc),
+            'COD_CONGL': '',
+            'NOME_CONGL': '',
+            'TAXONOMIA': 'BANCO MULTIPLO',
+            'CONTA': np.tile(account_codes, n_inst),
+            'NOME_CONTA': np.tile(account_names, n_inst),
+            'SALDO': _format_saldo(saldo.ravel()).values
+        }, columns=CSV_COLUMNS)
+
+        path = os.path.join(root_dir, f"{date.strftime('%Y%m')}BANCOS.CSV")
+        with open(path, 'w', encoding='latin1', newline='') as f:
+            f.write("Balancete/Balanco Geral (Sintetico)\nData de geracao dos dados: 2025-01-01\nFonte: benchmark.py\n")
+            frame.to_csv(f, sep=';', index=False, lineterminator='\n')
+        csv_bytes += os.path.getsize(path)
+
+    mapped = [(i, n) for i, n in enumerate(names) if n in data_loader.NAME_TO_TICKER]
+    with pd.ExcelWriter(os.path.join(root_dir, 'historical', 'Balancetes_por_ticker.xlsx')) as writer:
+        for i, name in mapped:
+            profit = monthly_profit[:excel_months, i]
+            sheet = pd.DataFrame({
+                '#DATA_BASE': [int(d.strftime('%Y%m')) for d in dates[:excel_months]],
+                'CNPJ': cnpjs[i],
+                'NOME_INSTITUICAO': name,
+                'LUCRO': profit,
+                'LUCRO ACUMULADO': np.cumsum(profit),
+                'PATRIMÔNIO LÍQUIDO': rng.uniform(1e8, 2e11, size=min(excel_months, months))
+            })
+            sheet.to_excel(writer, sheet_name=data_loader.NAME_TO_TICKER[name], index=False)
+
+    tickers = [data_loader.NAME_TO_TICKER[n] + '4' for _, n in mapped]
+    tickers += [f"SY{i:02d}3" for i in range(max(len(names) - len(mapped), 0))]
+    valuation = pd.DataFrame({
+        'Papel': tickers,
+        'Cotação': _format_saldo(rng.uniform(1, 100, size=len(tickers))).values,
+        'P/L': _format_saldo(rng.uniform(2, 20, size=len(tickers))).values,
+        'P/VP': _format_saldo(rng.uniform(0.3, 3, size=len(tickers))).values,
+        'PSR': '0,00',
+        'Div.Yield': [f"{v:.2f}%".replace('.', ',') for v in rng.uniform(0, 15, size=len(tickers))]
+    })
+    valuation.to_excel(os.path.join(root_dir, 'multiplos.xlsx'), index=False)
+
+    return {'months': months, 'excel_months': excel_months, 'institutions': len(names),
+            'accounts': len(account_codes), 'csv_rows': months * len(names) * len(account_codes),
+            'csv_mb': csv_bytes / 1e6}
+
+
+def measure(name, func, rows_in=None, mb_in=None):
+    """
+    Runs func once with stdout silenced, as an ETL stage under tracemalloc.
+    Returns (result, stats) with wall time, peak traced memory and throughput.
+    The peak is the stage's own (nested stages included): stages reset tracemalloc's peak on
+    entry, so get_traced_memory() at the end would only see what followed the last one.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), data_loader.etl_stage(f"benchmark.{name}"):
+        result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    stats = {'seconds': elapsed, 'peak_mb': data_loader.STAGE_LOG[-1]['peak_mb']}
+    if rows_in:
+        stats['rows_per_s'] = rows_in / elapsed if elapsed else float('inf')
+    if mb_in:
+        stats['mb_per_s'] = mb_in / elapsed if elapsed else float('inf')
+    if isinstance(result, pd.DataFrame):
+        stats['rows_out'] = len(result)
+    elif isinstance(result, dict):
+        stats['rows_out'] = sum(len(v) for v in result.values())
+    return result, stats
+
+
+def run_benchmarks(root_dir, info, full_universe=False):
+    historical = os.path.join(root_dir, 'historical')
+    results = {}
+
+    # Cold: no Parquet caches or workbook snapshot
+    df, results['load_initial_data (cold)'] = measure(
+        'load_initial_data', lambda: data_loader.load_initial_data(historical, use_cache=False, full_universe=full_universe),
+        rows_in=info['csv_rows'], mb_in=info['csv_mb'])
+
+    # Warm: first call fills the caches, second one is measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_loader.load_initial_data(historical, full_universe=full_universe)
+    _, results['load_initial_data (warm)'] = measure(
+        'load_initial_data', lambda: data_loader.load_initial_data(historical, full_universe=full_universe),
+        rows_in=info['csv_rows'], mb_in=info['csv_mb'])
+
+    empty = pd.DataFrame(columns=['Ticker', 'Date', 'MonthlyProfit', 'Equity'])
+    _, results['load_csv_data (cold)'] = measure(
+        'load_csv_data', lambda: data_loader.load_csv_data(root_dir, empty, use_cache=False, full_universe=full_universe),
+        rows_in=info['csv_rows'], mb_in=info['csv_mb'])
+
+    _, results['load_valuation_data'] = measure(
+        'load_valuation_data', lambda: data_loader.load_valuation_data(root_dir))
+
+    _, results['compute_latest_snapshot'] = measure(
+        'compute_latest_snapshot', lambda: data_loader.compute_latest_snapshot(df), rows_in=len(df))
+
+    _, results['partition_by_ticker'] = measure(
+        'partition_by_ticker', lambda: data_loader.partition_by_ticker(df), rows_in=len(df))
+
+    return results
+
+
+def report(results, baseline=None):
+    print(f"{'Stage':<28}{'Time (s)':>10}{'Peak MB':>10}{'MB/s':>10}{'Rows/s':>14}{'vs base':>10}")
+    for stage, stats in results.items():
+        delta = ''
+        if baseline and stage in baseline and baseline[stage]['seconds']:
+            change = stats['seconds'] / baseline[stage]['seconds'] - 1
+            delta = f"{change:+.0%}"
+        mb_s = f"{stats['mb_per_s']:.1f}" if 'mb_per_s' in stats else '-'
+        rows_s = f"{stats['rows_per_s']:,.0f}" if 'rows_per_s' in stats else '-'
+        print(f"{stage:<28}{stats['seconds']:>10.3f}{stats['peak_mb']:>10.1f}{mb_s:>10}{rows_s:>14}{delta:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the balancete loaders on synthetic data.")
+    parser.add_argument('--months', type=int, default=24, help="Monthly CSV files to generate")
+    parser.add_argument('--excel-months', type=int, default=12, help="Months also present in the workbook")
+    parser.add_argument('--institutions', type=int, default=50, help="Institutions per CSV")
+    parser.add_argument('--accounts', type=int, default=100, help="Accounts per institution")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--full-universe', action='store_true', help="Ingest every institution, not only mapped banks")
+    parser.add_argument('--data-dir', help="Keep the generated data here (default: temporary directory)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    args = parser.parse_args()
+
+    root_dir = args.data_dir or tempfile.mkdtemp(prefix='balancetes_bench_')
+    try:
+        t0 = time.perf_counter()
+        info = generate_dataset(root_dir, args.months, args.excel_months, args.institutions, args.accounts, args.seed)
+        print(f"Generated {info['months']} months x {info['institutions']} institutions x {info['accounts']} accounts "
+              f"({info['csv_rows']:,} CSV rows, {info['csv_mb']:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+        results = run_benchmarks(root_dir, info, args.full_universe)
+
+        key = f"m{args.months}-x{args.excel_months}-i{args.institutions}-a{args.accounts}"
+        if args.full_universe:
+            key += '-full'
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baselines = json.load(f)
+        report(results, baselines.get(key))
+
+        if args.save_baseline:
+            baselines[key] = results
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(baselines, f, indent=2)
+            print(f"Baseline '{key}' saved to {args.baseline}")
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,257 +1,918 @@
 import pandas as pd
 import os
 import re
+import json
+import hashlib
+import zipfile
+import threading
+import time
+import logging
+import tracemalloc
+import functools
+import contextlib
+import collections
+import shutil
 
-def load_csv_data(directory, existing_df):
+# Parsed balancetes are cached here (relative to the CSV directory) as Parquet
+CACHE_DIR_NAME = '.balancetes_cache'
+
+# Map CSV Names to Tickers
+NAME_TO_TICKER = {
+    'BCO DO BRASIL S.A.': 'BBAS',
+    'BCO BRADESCO S.A.': 'BBDC',
+    'BCO SANTANDER (BRASIL) S.A.': 'SANB',
+    'ITAÚ UNIBANCO HOLDING S.A.': 'ITUB',
+    'BCO ABC BRASIL S.A.': 'ABCB',
+    'BCO DA AMAZONIA S.A.': 'BAZA',
+    'BCO MERCANTIL DO BRASIL S.A.': 'BMEB',
+    'BCO BMG S.A.': 'BMGB',
+    'BCO PINE S.A.': 'PINE',
+    'BCO DO ESTADO DO RS S.A.': 'BRSR',
+    'BANCO BTG PACTUAL S.A.': 'BPAC',
+    'BCO DO EST. DE SE S.A.': 'BGIP',
+    'BCO BANESTES S.A.': 'BEES',
+    'BRB - BCO DE BRASILIA S.A.': 'BLIS',
+    'BANCO PAN': 'BPAN',
+    'NU FINANCEIRA S.A. - SOCIEDADE DE CRÉDITO, FINANCIAMENTO E INVESTIMENTO': 'ROXO',
+    'BANCO INTER': 'INBR',
+    'BCO XP S.A.': 'XPBR'
+}
+
+# Full-universe mode: unlisted institutions are keyed by their 8-digit CNPJ root (e.g. 'CNPJ00416968')
+INSTITUTION_KEY_PREFIX = 'CNPJ'
+
+# 7000000003: Income, 8000000002: Expense (Negative), 6100000007: Equity
+ACCOUNT_INCOME = 7000000003
+ACCOUNT_EXPENSE = 8000000002
+ACCOUNT_EQUITY = 6100000007
+
+# Incremental mode: materialized dataset + per-ticker rolling-window state, one checkpoint per
+# institution universe under materialized/<listed|full>/ (inside CACHE_DIR_NAME)
+MATERIALIZED_DIR_NAME = 'materialized'
+MATERIALIZED_DATASET_FILE = 'dataset.parquet'
+MATERIALIZED_STATE_FILE = 'window_state.parquet'
+MATERIALIZED_META_FILE = 'dataset.json'
+# Raw CSV extracts behind the dataset's CSV-derived rows, to re-derive semesters on late or revised months
+MATERIALIZED_EXTRACTS_FILE = 'extracts.parquet'
+EXTRACT_COLUMNS = ['Ticker', 'Date', 'CumulativeResult', 'Equity']
+
+# Precomputed dashboard artifacts (inside CACHE_DIR_NAME): artifacts/<universe>/<version>/ holds
+# uncompressed Arrow IPC files (memory-mapped by the app); CURRENT names the version to serve
+ARTIFACTS_DIR_NAME = 'artifacts'
+ARTIFACT_DATASET_FILE = 'dataset.arrow'
+ARTIFACT_SNAPSHOT_FILE = 'snapshot.arrow'
+ARTIFACT_MANIFEST_FILE = 'manifest.json'
+ARTIFACT_CURRENT_FILE = 'CURRENT'
+ARTIFACT_FORMAT = 2
+
+# Full-account store (inside CACHE_DIR_NAME): every balancete line, one Parquet file per month
+# under accounts/month=YYYYMM/ (hive partitioning) plus index.json of the ingested sources
+ACCOUNT_STORE_DIR_NAME = 'accounts'
+ACCOUNT_STORE_INDEX_FILE = 'index.json'
+ACCOUNT_STORE_VIEW = 'balancetes'
+
+# Account time series (inside CACHE_DIR_NAME): the account store consolidated into one Arrow IPC
+# file sorted by (Ticker, CONTA, month) + an offset index, under account_series/<version>/
+ACCOUNT_SERIES_DIR_NAME = 'account_series'
+ACCOUNT_SERIES_FILE = 'series.arrow'
+ACCOUNT_SERIES_INDEX_FILE = 'index.arrow'
+
+# Valuation quotes: live source and its on-disk TTL cache (inside CACHE_DIR_NAME)
+FUNDAMENTUS_URL = "https://www.fundamentus.com.br/resultado.php"
+VALUATION_CACHE_FILE = 'fundamentus.parquet'
+VALUATION_TTL_SECONDS = 15 * 60
+
+# Rolling metrics produced by compute_kpis()
+KPI_COLUMNS = ['Accumulated12mProfit', 'MonthlyProfit_SMA12', 'Accumulated3mProfit', 'ROE', 'ProjectedROE3m']
+
+# --- ETL instrumentation ---
+# Each stage emits one JSON line on the 'balancetes.etl' logger and is kept in STAGE_LOG
+# (most recent last) for the dashboard diagnostics panel. Peak memory is only measured
+# while tracemalloc is tracing (see set_memory_tracing), since tracing slows allocations.
+etl_logger = logging.getLogger('balancetes.etl')
+STAGE_LOG = collections.deque(maxlen=1000)
+_stage_context = threading.local()
+
+def set_memory_tracing(enabled):
     """
-    Loads data from Central Bank CSV files (*BANCOS.CSV).
-    Calculates Monthly Profit from Semester Cumulative Data.
-    Merges with existing DataFrame.
+    Starts or stops tracemalloc so etl_stage records peak memory (peak_mb) per stage.
     """
-    import glob
-    import os
-    
-    # Map CSV Names to Tickers
-    NAME_TO_TICKER = {
-        'BCO DO BRASIL S.A.': 'BBAS',
-        'BCO BRADESCO S.A.': 'BBDC',
-        'BCO SANTANDER (BRASIL) S.A.': 'SANB',
-        'ITAÚ UNIBANCO HOLDING S.A.': 'ITUB',
-        'BCO ABC BRASIL S.A.': 'ABCB',
-        'BCO DA AMAZONIA S.A.': 'BAZA',
-        'BCO MERCANTIL DO BRASIL S.A.': 'BMEB',
-        'BCO BMG S.A.': 'BMGB',
-        'BCO PINE S.A.': 'PINE',
-        'BCO DO ESTADO DO RS S.A.': 'BRSR',
-        'BANCO BTG PACTUAL S.A.': 'BPAC',
-        'BCO DO EST. DE SE S.A.': 'BGIP',
-        'BCO BANESTES S.A.': 'BEES',
-        'BRB - BCO DE BRASILIA S.A.': 'BLIS',
-        'BANCO PAN': 'BPAN',
-        'NU FINANCEIRA S.A. - SOCIEDADE DE CRÉDITO, FINANCIAMENTO E INVESTIMENTO': 'ROXO',
-        'BANCO INTER': 'INBR',
-        'BCO XP S.A.': 'XPBR'
-    }
-    
-    csv_files = glob.glob(os.path.join(directory, "*BANCOS.CSV"))
-    print(f"Found {len(csv_files)} CSV files.")
-    
-    new_rows = []
-    
-    for file_path in sorted(csv_files):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+@contextlib.contextmanager
+def etl_stage(name, rows_in=None, **fields):
+    """
+    Times a pipeline stage. Yields a dict where the stage can set 'rows_out' (and other fields).
+    On exit records wall time, rows in/out, nesting depth and, while tracing, peak memory above
+    the level at entry (nested stages included).
+    """
+    stack = getattr(_stage_context, 'stack', None)
+    if stack is None:
+        stack = _stage_context.stack = []
+
+    tracing = tracemalloc.is_tracing()
+    frame = {'rows_out': None}
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+        tracemalloc.reset_peak()
+        frame['_start_mem'] = frame['_peak'] = current
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        record = {'stage': name, 'seconds': round(elapsed, 6), 'rows_in': rows_in, 'rows_out': frame.pop('rows_out'),
+                  'depth': len(stack), 'ts': time.time()}
+        if tracing and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            abs_peak = max(frame.pop('_peak'), peak)
+            record['peak_mb'] = round((abs_peak - frame.pop('_start_mem')) / 1e6, 3)
+            if stack and '_peak' in stack[-1]:
+                stack[-1]['_peak'] = max(stack[-1]['_peak'], abs_peak)
+        record.update({k: v for k, v in frame.items() if not k.startswith('_')})
+        record.update(fields)
+        STAGE_LOG.append(record)
+        etl_logger.info(json.dumps(record, default=str))
+
+def instrumented(name):
+    """
+    Decorator form of etl_stage for whole loader functions (rows_out = len of the returned frame).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with etl_stage(name) as stage:
+                result = func(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    stage['rows_out'] = len(result)
+                return result
+        return wrapper
+    return decorator
+
+# Monthly files as published by the Central Bank: 202508BANCOS.CSV or 202508BANCOS.csv.zip
+BALANCETE_FILE_RE = re.compile(r'BANCOS\.CSV(\.ZIP)?$', re.IGNORECASE)
+
+def find_balancete_files(directory):
+    """
+    Lists monthly balancetes in directory, plain (*BANCOS.CSV) or zipped (*BANCOS.csv.zip).
+    Files are de-duplicated by month (YYYYMM file prefix); a plain CSV wins over its archive.
+    Returns paths sorted by month.
+    """
+    by_month = {}
+    for name in sorted(os.listdir(directory)):
+        match = BALANCETE_FILE_RE.search(name)
+        if not match:
+            continue
+        month = name[:6] if name[:6].isdigit() else name
+        is_zip = match.group(1) is not None
+        if month in by_month and is_zip:
+            continue
+        by_month[month] = os.path.join(directory, name)
+    return [by_month[m] for m in sorted(by_month)]
+
+def _file_sha256(file_path):
+    """
+    Streams the file through SHA-256 (1 MB chunks) and returns the hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def parse_br_numbers(values, percent=False):
+    """
+    Vectorized pt-BR number parsing for a whole column ('.' thousands, ',' decimal):
+    '1.234,56' -> 1234.56 and '6,75%' -> 0.0675. Cells that are already numeric are kept as is.
+    percent=True treats every value as a percentage (numbers without '%' are divided by 100 too).
+    Unparseable cells become NaN. Returns a float Series.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values.astype('float64')
+        return numbers / 100 if percent else numbers
+
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        # All-text object column: a string dtype makes the .str ops below array operations
+        values = values.astype(pd.StringDtype())
+
+    # .str yields NaN for non-string cells (e.g. floats read from Excel), handled separately
+    text = values.str.strip()
+    is_text = text.notna()
+    is_percent = text.str.endswith('%', na=False)
+    text = text.str.replace('%', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+
+    try:
+        # Fast path: a direct cast; only columns with unparseable cells pay for to_numeric
+        numbers = text.astype('float64')
+    except (TypeError, ValueError):
+        numbers = pd.to_numeric(text, errors='coerce')
+    numbers = numbers.where(is_text, pd.to_numeric(values.where(~is_text), errors='coerce')).astype('float64')
+    return numbers / 100 if percent else numbers.where(~is_percent, numbers / 100)
+
+# Parse-time dtypes for the raw balancete: repeated names as categoricals, SALDO as float
+# (pt-BR: '.' thousands, ',' decimal) and the month as an int32 YYYYMM code
+BALANCETE_DTYPES = {
+    '#DATA_BASE': 'int32',
+    'NOME_INSTITUICAO': 'category',
+    'NOME_CONTA': 'category',
+    'TAXONOMIA': 'category',
+    'CONTA': 'int64',
+    'SALDO': 'float64'
+}
+
+# Bump when the parsed frame layout changes, so older Parquet caches are not reused
+BALANCETE_SCHEMA_VERSION = 2
+
+def _read_balancete_csv(source):
+    # Read CSV (Skip 3 rows, Latin1)
+    return pd.read_csv(source, encoding='latin1', sep=';', skiprows=3,
+                       dtype=BALANCETE_DTYPES, decimal=',', thousands='.')
+
+def _parse_balancete(file_path):
+    if file_path.lower().endswith('.zip'):
+        # Stream the CSV member straight out of the archive (no extraction to disk)
+        with zipfile.ZipFile(file_path) as zf:
+            members = [n for n in zf.namelist() if n.upper().endswith('.CSV')]
+            if not members:
+                raise ValueError(f"No CSV member in {os.path.basename(file_path)}")
+            with zf.open(members[0]) as f:
+                return _read_balancete_csv(f)
+    return _read_balancete_csv(file_path)
+
+def read_balancete(file_path, cache_dir=None):
+    """
+    Reads a single Central Bank balancete (*BANCOS.CSV or *BANCOS.csv.zip).
+    When cache_dir is given, the parsed frame is kept there as Parquet, keyed by the
+    SHA-256 of the source file. A sidecar '<file name>.json' records size, mtime and hash:
+    - size and mtime unchanged -> cached Parquet is read directly (no hashing, no parsing)
+    - size or mtime changed    -> file is re-hashed; same hash reuses the Parquet, else re-parse
+    Falls back to plain parsing if Parquet support (pyarrow) is not installed.
+    """
+    if cache_dir is None:
+        with etl_stage('csv.parse', file=os.path.basename(file_path)) as stage:
+            df = _parse_balancete(file_path)
+            stage['rows_out'] = len(df)
+        return df
+
+    stat = os.stat(file_path)
+    meta_path = os.path.join(cache_dir, os.path.basename(file_path) + '.json')
+
+    meta = None
+    if os.path.exists(meta_path):
         try:
-            print(f"Processing {os.path.basename(file_path)}...")
-            # Read CSV (Skip 3 rows, Latin1)
-            df = pd.read_csv(file_path, encoding='latin1', sep=';', skiprows=3)
-            
-            # Extract Date (Format YYYYMM)
-            # Assuming all rows have same date, take from first row
-            if df.empty:
-                continue
-            
-            # Column name for date might vary? Inspection showed #DATA_BASE
-            date_col = next((c for c in df.columns if 'DATA' in str(c).upper()), None)
-            if not date_col:
-                print("Date column not found.")
-                continue
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
 
-            date_str = str(df.iloc[0][date_col])
-            curr_date = pd.to_datetime(date_str, format='%Y%m')
-            print(f"  Date detected: {curr_date.strftime('%Y-%m')}")
-            
-            # Filter for mapped banks
-            for inst_name, ticker in NAME_TO_TICKER.items():
-                # Check if Ticker + Date already exists in existing_df
-                if not existing_df.empty:
-                    exists = ((existing_df['Ticker'] == ticker) & (existing_df['Date'] == curr_date)).any()
-                    if exists:
-                        # print(f"  Skipping {ticker} (already exists).")
-                        continue
-
-                df_bank = df[df['NOME_INSTITUICAO'] == inst_name]
-                if df_bank.empty:
-                    continue
-                
-                # Extract Values
-                def get_val(code):
-                    val = df_bank[df_bank['CONTA'] == code]['SALDO'].values
-                    if len(val) > 0:
-                        v_str = str(val[0])
-                        return float(v_str.replace('.', '').replace(',', '.'))
-                    return 0.0
-                
-                # 7000000003: Income, 8000000002: Expense (Negative), 6100000007: Equity
-                income = get_val(7000000003)
-                expense = get_val(8000000002)
-                equity = get_val(6100000007)
-                
-                cumulative_result = income + expense
-                
-                # LOGIC: Monthly Profit = Cumulative Result - Sum(Profits of previous months in semester)
-                # Semester starts: Month 1 or Month 7.
-                semester_start_month = 1 if curr_date.month <= 6 else 7
-                semester_start_date = pd.Timestamp(curr_date.year, semester_start_month, 1)
-                
-                # Get sums from Existing DF + New Rows processed so far
-                mask_excel = (existing_df['Ticker'] == ticker) & \
-                             (existing_df['Date'] >= semester_start_date) & \
-                             (existing_df['Date'] < curr_date)
-                sum_excel = existing_df[mask_excel]['MonthlyProfit'].sum()
-                
-                sum_new = 0
-                for row in new_rows:
-                    if row['Ticker'] == ticker and row['Date'] >= semester_start_date and row['Date'] < curr_date:
-                        sum_new += row['MonthlyProfit']
-                        
-                prior_profit_sum = sum_excel + sum_new
-                
-                monthly_profit = cumulative_result - prior_profit_sum
-                
-                new_rows.append({
-                    'Ticker': ticker,
-                    'Date': curr_date,
-                    'MonthlyProfit': monthly_profit,
-                    'Equity': equity,
-                    'Accumulated12mProfit': 0, # Placeholders
-                    'MonthlyProfit_SMA12': 0,
-                    'ProjectedROE3m': 0,
-                    'ROE': 0,
-                    'Accumulated3mProfit': 0
-                })
-                
+    if meta and meta.get('size') == stat.st_size and meta.get('mtime_ns') == stat.st_mtime_ns:
+        sha = meta['sha256']
+    else:
+        sha = _file_sha256(file_path)
+
+    parquet_path = os.path.join(cache_dir, f"{sha}.v{BALANCETE_SCHEMA_VERSION}.parquet")
+    if os.path.exists(parquet_path):
+        try:
+            df = pd.read_parquet(parquet_path)
         except Exception as e:
-            print(f"Error processing {os.path.basename(file_path)}: {e}")
-            
-    if new_rows:
-        new_df = pd.DataFrame(new_rows)
-        # Combine
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        # Sort
-        combined_df = combined_df.sort_values(by=['Ticker', 'Date']).reset_index(drop=True)
-        
-        # Re-calculate KPIs
-        final_dfs = []
-        for ticker in combined_df['Ticker'].unique():
-            t_df = combined_df[combined_df['Ticker'] == ticker].copy().sort_values(by='Date')
-            
-            # Recalculate Rolling Metrics
-            t_df['Accumulated12mProfit'] = t_df['MonthlyProfit'].rolling(window=12, min_periods=12).sum()
-            t_df['MonthlyProfit_SMA12'] = t_df['MonthlyProfit'].rolling(window=12, min_periods=12).mean()
-            
-            # Recalculate ROE & Projected
-            t_df['Accumulated3mProfit'] = t_df['MonthlyProfit'].rolling(window=3, min_periods=3).sum()
-            
-            t_df['ROE'] = t_df.apply(
-                lambda row: row['Accumulated12mProfit'] / row['Equity'] if row['Equity'] != 0 else 0, axis=1
-            )
-            
-            t_df['ProjectedROE3m'] = t_df.apply(
-                lambda row: (row['Accumulated3mProfit'] * 4) / row['Equity'] if row['Equity'] != 0 else 0, axis=1
-            )
-            
-            final_dfs.append(t_df)
-            
-        return pd.concat(final_dfs, ignore_index=True)
-        
-    return existing_df
+            print(f"  Cache read failed ({e}), re-parsing.")
+            df = None
+    else:
+        df = None
+
+    if df is None:
+        with etl_stage('csv.parse', file=os.path.basename(file_path)) as stage:
+            df = _parse_balancete(file_path)
+            stage['rows_out'] = len(df)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = parquet_path + '.tmp'
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+        except ImportError:
+            # No Parquet engine available: cache disabled, data still valid
+            return df
+        except Exception as e:
+            print(f"  Could not write cache for {os.path.basename(file_path)}: {e}")
+            return df
+
+    # Refresh sidecar whenever the signature moved (new file, touched file, new content)
+    if not meta or meta.get('sha256') != sha or meta.get('size') != stat.st_size \
+            or meta.get('mtime_ns') != stat.st_mtime_ns:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}, f)
+        except OSError as e:
+            print(f"  Could not write cache metadata for {os.path.basename(file_path)}: {e}")
 
+    return df
 
-def load_initial_data(directory):
+def balancete_month(df):
     """
-    Loads data from the single historical file 'Balancetes_por_ticker.xlsx'.
-    Iterates through sheets (Ticker) and extracts Profit/Equity.
-    Returns a single consolidated DataFrame.
+    Reference month of a parsed balancete as an int YYYYMM code, taken from the first row
+    of its date column ('#DATA_BASE'; found by name, since its prefix varies).
+    Returns None when the frame is empty or has no date column.
     """
-    all_data = []
+    date_col = next((c for c in df.columns if 'DATA' in str(c).upper()), None)
+    if df.empty or date_col is None:
+        return None
+    return int(df[date_col].iloc[0])
+
+def build_account_index(df, institutions=None, accounts=None):
+    """
+    Pivots one month of a balancete into a frame indexed by NOME_INSTITUICAO with one
+    float column per CONTA (SALDO already float from read_balancete, or parsed from pt-BR
+    text). Built in a single pass, so any set of (institution, account) values is then one
+    vectorized lookup.
+    Optional institutions/accounts restrict the pivot; the first row wins on duplicates.
+    """
+    mask = pd.Series(True, index=df.index)
+    if institutions is not None:
+        mask &= df['NOME_INSTITUICAO'].isin(list(institutions))
+    if accounts is not None:
+        mask &= df['CONTA'].isin(list(accounts))
+
+    rows = df.loc[mask, ['NOME_INSTITUICAO', 'CONTA', 'SALDO']]
+    rows = rows.drop_duplicates(subset=['NOME_INSTITUICAO', 'CONTA'], keep='first')
+    # Categorical names (compact read) become plain labels so the pivot only holds matched rows
+    rows = rows.assign(NOME_INSTITUICAO=rows['NOME_INSTITUICAO'].astype(str),
+                       SALDO=parse_br_numbers(rows['SALDO']))
+
+    return rows.pivot(index='NOME_INSTITUICAO', columns='CONTA', values='SALDO')
+
+def institution_keys(df, name_to_ticker):
+    """
+    Maps each institution of a balancete to its key: the ticker for mapped names, else
+    INSTITUTION_KEY_PREFIX + 8-digit CNPJ root (stable across renames).
+    Returns a Series indexed by NOME_INSTITUICAO.
+    """
+    firms = df[['NOME_INSTITUICAO', 'CNPJ']].drop_duplicates(subset='NOME_INSTITUICAO')
+    names = firms['NOME_INSTITUICAO'].astype(str)
+    cnpj_keys = INSTITUTION_KEY_PREFIX + firms['CNPJ'].astype('int64').astype(str).str.zfill(8)
+    keys = names.map(name_to_ticker).fillna(cnpj_keys)
+    return pd.Series(keys.values, index=names.values)
+
+def institution_names(directory, use_cache=True, name_to_ticker=None):
+    """
+    Display names for full-universe keys ({key: NOME_INSTITUICAO}), taken from the most
+    recent balancete in directory. Empty dict when there is none.
+    """
+    if name_to_ticker is None:
+        name_to_ticker = NAME_TO_TICKER
+    csv_files = find_balancete_files(directory)
+    if not csv_files:
+        return {}
+    cache_dir = os.path.join(directory, CACHE_DIR_NAME) if use_cache else None
+    keys = institution_keys(read_balancete(csv_files[-1], cache_dir), name_to_ticker)
+    return dict(zip(keys.values, keys.index))
+
+def extract_month(df, curr_date, name_to_ticker, full_universe=False):
+    """
+    Extracts [Ticker, Date, CumulativeResult, Equity] for the mapped institutions of one month.
+    full_universe=True extracts every institution in the file (see institution_keys).
+    Institutions absent from the file are dropped; missing accounts count as 0.0.
+    """
+    accounts = [ACCOUNT_INCOME, ACCOUNT_EXPENSE, ACCOUNT_EQUITY]
+    if full_universe:
+        keys = institution_keys(df, name_to_ticker)
+        index = build_account_index(df, accounts=accounts)
+    else:
+        keys = pd.Series(name_to_ticker)
+        index = build_account_index(df, institutions=name_to_ticker.keys(), accounts=accounts)
+    # Institutions present in the file, even if none of the three accounts are
+    present = pd.Index(df['NOME_INSTITUICAO'].unique().astype(str)).intersection(keys.index)
+    values = index.reindex(index=present, columns=accounts).fillna(0.0)
+
+    return pd.DataFrame({
+        'Ticker': keys.reindex(values.index).values,
+        'Date': curr_date,
+        'CumulativeResult': values[ACCOUNT_INCOME] + values[ACCOUNT_EXPENSE],
+        'Equity': values[ACCOUNT_EQUITY]
+    }).reset_index(drop=True)
+
+def _semester_id(dates):
+    # Semester id: 2 * year + (0 for Jan-Jun, 1 for Jul-Dec)
+    return dates.dt.year * 2 + (dates.dt.month > 6).astype(int)
+
+def deaccumulate_semester_results(new_df, existing_df):
+    """
+    Converts semester-cumulative results (CSV: 7000000003 + 8000000002) into Monthly Profit.
+    new_df: [Ticker, Date, CumulativeResult, Equity]; existing_df: [Ticker, Date, MonthlyProfit, ...].
+
+    LOGIC: Monthly Profit = Cumulative Result - Sum(Profits of previous months in semester),
+    with semesters starting in month 1 or 7 and the sum covering existing and new rows.
+    Vectorized over all tickers and months: within each (Ticker, Semester), sorted by Date,
+    the running cumulative result C is re-anchored at every CSV row (C = CumulativeResult) and
+    advanced by MonthlyProfit on existing rows, so each new row is CumulativeResult - C(previous).
+    Returns new_df rows with MonthlyProfit and zeroed KPI placeholders.
+    """
+    new = new_df[['Ticker', 'Date', 'CumulativeResult', 'Equity']].copy()
+    new['Date'] = pd.to_datetime(new['Date'])
+    new['_is_new'] = True
+    new['_semester'] = _semester_id(new['Date'])
+    if not existing_df.empty and {'Ticker', 'Date', 'MonthlyProfit'}.issubset(existing_df.columns):
+        old = existing_df[['Ticker', 'Date', 'MonthlyProfit']].copy()
+        old['Date'] = pd.to_datetime(old['Date'])
+        old['_is_new'] = False
+        old['_semester'] = _semester_id(old['Date'])
+        # Only the (Ticker, Semester) groups that receive new rows matter
+        touched = pd.MultiIndex.from_frame(new[['Ticker', '_semester']].drop_duplicates())
+        old = old[pd.MultiIndex.from_frame(old[['Ticker', '_semester']]).isin(touched)]
+        frame = pd.concat([old, new], ignore_index=True)
+    else:
+        frame = new
+
+    frame = frame.sort_values(by=['Ticker', '_semester', 'Date', '_is_new'], kind='mergesort')
+    # (Ticker, Semester) factorized once for the three grouped passes below
+    keys = frame.groupby(['Ticker', '_semester'], sort=False).ngroup()
+
+    # Running sum of existing monthly profits (CSV rows contribute 0)
+    old_profit = frame['MonthlyProfit'].where(~frame['_is_new'], 0.0).fillna(0.0) \
+        if 'MonthlyProfit' in frame.columns else pd.Series(0.0, index=frame.index)
+    running_old = old_profit.groupby(keys).cumsum()
+
+    # Anchor = CumulativeResult - running_old at CSV rows, forward-filled within the semester
+    anchor = (frame['CumulativeResult'] - running_old).where(frame['_is_new'])
+    anchor = anchor.groupby(keys).ffill().fillna(0.0)
+    cumulative = anchor + running_old
+    prior = cumulative.groupby(keys).shift(1).fillna(0.0)
+
+    frame['MonthlyProfit'] = frame['CumulativeResult'] - prior
+    result = frame[frame['_is_new']].sort_values(by=['Date', 'Ticker'], kind='mergesort')
+
+    result = result[['Ticker', 'Date', 'MonthlyProfit', 'Equity']].reset_index(drop=True)
+    for col in KPI_COLUMNS:
+        result[col] = 0 # Placeholders
+    return result
+
+def _trailing_sum(values, position, window):
+    # Sum of each ticker's last window values (rows sorted by Ticker, Date): NaN until the ticker
+    # has window rows or when one of them is NaN, as a grouped rolling(window, min_periods=window)
+    total = values.copy()
+    for lag in range(1, window):
+        total = total + values.shift(lag)
+    return total.where(position >= window - 1)
+
+def compute_kpis(df):
+    """
+    Shared KPI engine for the Excel and CSV loaders.
+    Computes, for all tickers at once (grouped rolling windows + array arithmetic):
+    - Accumulated12mProfit / MonthlyProfit_SMA12: 12m rolling sum / mean (needs 12 months)
+    - Accumulated3mProfit: 3m rolling sum (needs 3 months)
+    - ROE: Accumulated12mProfit / Equity (LTM ROE)
+    - ProjectedROE3m: (Accumulated3mProfit * 4) / Equity (3 months annualized)
+    ROE and ProjectedROE3m are NaN when Equity is 0 or the window is incomplete.
+    Returns a copy sorted by [Ticker, Date].
+    """
+    df = df.sort_values(by=['Ticker', 'Date'], kind='mergesort').reset_index(drop=True)
+    if df.empty:
+        for col in KPI_COLUMNS:
+            df[col] = pd.Series(dtype=float)
+        return df
+
+    # Shifted sums over the sorted frame: no per-ticker window objects, so the cost does not
+    # grow with the number of tickers (full universe, one call per month while backfilling)
+    profit = df['MonthlyProfit'].astype(float)
+    position = df.groupby('Ticker', sort=False).cumcount()
+    df['Accumulated12mProfit'] = _trailing_sum(profit, position, 12)
+    df['MonthlyProfit_SMA12'] = df['Accumulated12mProfit'] / 12
+    df['Accumulated3mProfit'] = _trailing_sum(profit, position, 3)
+
+    equity = df['Equity'].astype(float)
+    equity = equity.where(equity != 0)
+    df['ROE'] = df['Accumulated12mProfit'] / equity
+    df['ProjectedROE3m'] = (df['Accumulated3mProfit'] * 4) / equity
+
+    return df
+
+def compute_latest_snapshot(df):
+    """
+    Latest-snapshot table: one row per Ticker (sorted) with the figures the overview and
+    valuation views display, computed with grouped operations instead of per-ticker loops:
+    [Ticker, Date, LastProfit, PenultimateProfit, ProfitVarMoM, Last3mProfit, Last12mProfit,
+     ROE, ProjectedROE3m, Equity]
+    ProfitVarMoM is (last - penultimate) / |penultimate| as a fraction, 0 when undefined.
+    Last3mProfit / Last12mProfit sum MonthlyProfit over Date > last Date - 3 / 12 months.
+    """
+    columns = ['Ticker', 'Date', 'LastProfit', 'PenultimateProfit', 'ProfitVarMoM', 'Last3mProfit',
+               'Last12mProfit', 'ROE', 'ProjectedROE3m', 'Equity']
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df = df.sort_values(by=['Ticker', 'Date'], kind='mergesort').reset_index(drop=True)
+    grouped = df.groupby('Ticker', sort=False)
+    last_date = grouped['Date'].transform('max')
+    profit = df['MonthlyProfit']
+
+    sums = pd.DataFrame({
+        'Last3mProfit': profit.where(df['Date'] > last_date - pd.DateOffset(months=3), 0.0),
+        'Last12mProfit': profit.where(df['Date'] > last_date - pd.DateOffset(months=12), 0.0)
+    }).groupby(df['Ticker'], sort=False).sum()
+
+    snapshot = df.assign(PenultimateProfit=grouped['MonthlyProfit'].shift(1))
+    snapshot = snapshot.groupby('Ticker', sort=False).tail(1).set_index('Ticker')
+    snapshot = snapshot.rename(columns={'MonthlyProfit': 'LastProfit'}).join(sums)
+
+    penult = snapshot['PenultimateProfit']
+    valid = penult.notna() & (penult != 0)
+    snapshot['ProfitVarMoM'] = ((snapshot['LastProfit'] - penult) / penult.abs()).where(valid, 0.0)
+
+    return snapshot.reset_index()[columns].sort_values(by='Ticker').reset_index(drop=True)
+
+def _partition_frame(df):
+    # Dataset sorted by (Ticker, Date) with the per-ticker chart columns Profit_Var / Equity_Var
+    df = df.sort_values(by=['Ticker', 'Date'], kind='mergesort').reset_index(drop=True)
+    grouped = df.groupby('Ticker', sort=False)
+    df['Profit_Var'] = grouped['MonthlyProfit'].diff()
+    df['Equity_Var'] = grouped['Equity'].diff()
+    return df
+
+def partition_by_ticker(df):
+    """
+    Splits the dataset into {Ticker: frame} partitions, each sorted by Date with a fresh index
+    and the derived chart columns Profit_Var / Equity_Var (month-over-month differences).
+    One sort and one grouped pass, so looking up a bank afterwards costs O(rows for that bank).
+    """
+    df = _partition_frame(df)
+    return {ticker: part.reset_index(drop=True) for ticker, part in df.groupby('Ticker', sort=True)}
+
+def kpi_window_state(df):
+    """
+    Rolling-window state per ticker: the last 11 rows [Ticker, Date, MonthlyProfit, Equity].
+    Enough context to extend the 12m/3m windows and the semester de-accumulation (at most
+    5 prior months) for months appended after each ticker's last date.
+    """
+    cols = ['Ticker', 'Date', 'MonthlyProfit', 'Equity']
+    if df.empty:
+        # Keeps the column dtypes, so appending to an empty state stays numeric
+        return df.reindex(columns=cols).reset_index(drop=True)
+    df = df.sort_values(by=['Ticker', 'Date'], kind='mergesort')
+    return df.groupby('Ticker', sort=False).tail(11)[cols].reset_index(drop=True)
+
+def append_kpis(new_df, window_state):
+    """
+    Computes KPIs for rows appended after each ticker's window state (see kpi_window_state).
+    Only the touched tickers are computed, over at most 11 context rows + the new rows.
+    Returns the new rows with KPI columns filled.
+    """
+    touched = window_state[window_state['Ticker'].isin(new_df['Ticker'].unique())]
+    context = pd.concat([touched.assign(_is_new=False), new_df.assign(_is_new=True)], ignore_index=True)
+    computed = compute_kpis(context)
+    return computed[computed['_is_new']].drop(columns='_is_new').reset_index(drop=True)
+
+def _appends_after_state(new_df, window_state):
+    # True when every new row is later than its ticker's last materialized month
+    if window_state.empty:
+        return True
+    last_dates = window_state.groupby('Ticker')['Date'].max()
+    first_new = new_df.groupby('Ticker')['Date'].min()
+    common = first_new.index.intersection(last_dates.index)
+    return bool((first_new[common] > last_dates[common]).all())
+
+def process_balancete_file(file_path, cache_dir=None, name_to_ticker=None, full_universe=False):
+    """
+    Per-month unit of work: parses one balancete and returns its compact extract
+    [Ticker, Date, CumulativeResult, Equity] (None when the file has no usable date).
+    full_universe=True keeps every institution, not only the mapped ones.
+    Independent of other months, so it can run in a worker process.
+    """
+    if name_to_ticker is None:
+        name_to_ticker = NAME_TO_TICKER
+
+    print(f"Processing {os.path.basename(file_path)}...")
+    with etl_stage('csv.read', file=os.path.basename(file_path)) as stage:
+        df = read_balancete(file_path, cache_dir)
+        stage['rows_out'] = len(df)
     
-    # Path to the new consolidated file
-    file_path = os.path.join(directory, 'Balancetes_por_ticker.xlsx')
+    # Extract Date (Format YYYYMM)
+    # Assuming all rows have same date, take from first row
+    if df.empty:
+        return None
+    month = balancete_month(df)
+    if month is None:
+        print("Date column not found.")
+        return None
+
+    curr_date = pd.to_datetime(str(month), format='%Y%m')
+    print(f"  Date detected: {curr_date.strftime('%Y-%m')}")
     
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        return pd.DataFrame()
+    with etl_stage('csv.extract', rows_in=len(df), file=os.path.basename(file_path)) as stage:
+        month_df = extract_month(df, curr_date, name_to_ticker, full_universe)
+        stage['rows_out'] = len(month_df)
+    return month_df
+
+def _extract_files(csv_files, cache_dir, workers=None, full_universe=False):
+    """
+    Yields (file_path, extract) for each file in the given (month) order.
+    workers > 1 spreads process_balancete_file over a ProcessPoolExecutor; failing files
+    are reported and yield None.
+    """
+    if not workers or workers <= 1 or len(csv_files) <= 1:
+        for file_path in csv_files:
+            try:
+                yield file_path, process_balancete_file(file_path, cache_dir, full_universe=full_universe)
+            except Exception as e:
+                print(f"Error processing {os.path.basename(file_path)}: {e}")
+                yield file_path, None
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
 
+    with ProcessPoolExecutor(max_workers=min(workers, len(csv_files))) as pool:
+        futures = [pool.submit(process_balancete_file, f, cache_dir, None, full_universe) for f in csv_files]
+        for file_path, future in zip(csv_files, futures):
+            try:
+                yield file_path, future.result()
+            except Exception as e:
+                print(f"Error processing {os.path.basename(file_path)}: {e}")
+                yield file_path, None
+
+def load_csv_data(directory, existing_df, use_cache=True, window_state=None, files=None, workers=None,
+                  full_universe=False, extracts=None):
+    """
+    Loads data from Central Bank CSV files (*BANCOS.CSV, or zipped *BANCOS.csv.zip).
+    Calculates Monthly Profit from Semester Cumulative Data.
+    Merges with existing DataFrame.
+    Parsed files are cached as Parquet under '<directory>/.balancetes_cache' (use_cache=False skips it).
+    Incremental mode: pass window_state (see kpi_window_state) when existing_df is a materialized
+    dataset that already carries KPIs; new months are then de-accumulated and their KPIs computed
+    from that state only, instead of recomputing every ticker's full history.
+    files restricts processing to the given paths (default: every balancete in directory).
+    workers > 1 parses the files in that many processes; the semester merge stays ordered.
+    full_universe=True ingests every institution in the files (mapped names keep their ticker,
+    the others are keyed by CNPJ root, see institution_keys).
+    extracts: the raw extracts behind existing_df's CSV-derived rows (see _merge_extracts), so late
+    or re-published months can re-derive their semesters; kept by the materialized dataset.
+    """
+    return _ingest_csv_files(directory, existing_df, use_cache, window_state, files, workers, full_universe,
+                             extracts)[0]
+
+@instrumented('load_csv_data')
+def _ingest_csv_files(directory, existing_df, use_cache=True, window_state=None, files=None, workers=None,
+                      full_universe=False, extracts=None):
+    # load_csv_data returning (dataset, extracts, applied files); files that failed are not applied
+    csv_files = find_balancete_files(directory) if files is None else files
+    print(f"Found {len(csv_files)} CSV files.")
+
+    cache_dir = os.path.join(directory, CACHE_DIR_NAME) if use_cache else None
+    new_frames = []
+    applied = []
+    for file_path, month_df in _extract_files(csv_files, cache_dir, workers, full_universe):
+        if month_df is None:
+            continue
+        applied.append(file_path)
+        new_frames.append(month_df)
+
+    df, extracts = _merge_extracts(existing_df, new_frames, window_state, extracts)
+    return df, extracts, applied
+
+def _empty_extracts():
+    return pd.DataFrame({'Ticker': pd.Series(dtype=str), 'Date': pd.Series(dtype='datetime64[ns]'),
+                         'CumulativeResult': pd.Series(dtype=float), 'Equity': pd.Series(dtype=float)})
+
+def _row_keys(df):
+    # Hashed (Ticker, Date) keys: vectorized existence checks
+    return pd.MultiIndex.from_arrays([df['Ticker'], pd.to_datetime(df['Date'])])
+
+def _semester_keys(df):
+    return pd.MultiIndex.from_arrays([df['Ticker'], _semester_id(pd.to_datetime(df['Date']))])
+
+def _merge_extracts(existing_df, new_frames, window_state=None, extracts=None):
+    """
+    Merges monthly extracts (see process_balancete_file) into existing_df.
+    extracts holds the raw extracts behind existing_df's CSV-derived rows; the other rows (the
+    workbook) win over CSV rows for the same Ticker + Date. A new extract for a month already in
+    extracts (a re-published file) replaces that month.
+    Months appended after window_state are de-accumulated and get KPIs from that state only.
+    Otherwise (late or replaced months) every touched (Ticker, Semester) group is de-accumulated
+    again from its raw cumulative results and the KPIs are recomputed over the full history.
+    Returns (dataset, extracts), with extracts updated.
+    """
+    if extracts is None:
+        extracts = _empty_extracts()
+    new_frames = [f for f in new_frames if f is not None and not f.empty]
+    if not new_frames:
+        return existing_df, extracts
+
+    new_df = pd.concat(new_frames, ignore_index=True)[EXTRACT_COLUMNS]
+    new_df['Date'] = pd.to_datetime(new_df['Date'])
+    replaced = extracts['Date'].isin(new_df['Date'].unique())
+    if not existing_df.empty:
+        seeded = _row_keys(existing_df)
+        seeded = seeded[~seeded.isin(_row_keys(extracts))]
+        new_df = new_df[~_row_keys(new_df).isin(seeded)].reset_index(drop=True)
+    if new_df.empty and not replaced.any():
+        return existing_df, extracts
+    merged_extracts = pd.concat([extracts[~replaced], new_df], ignore_index=True)
+
+    if window_state is not None:
+        if not replaced.any() and _appends_after_state(new_df, window_state):
+            with etl_stage('csv.deaccumulate', rows_in=len(new_df)) as stage:
+                new_df = deaccumulate_semester_results(new_df, window_state)
+                stage['rows_out'] = len(new_df)
+            with etl_stage('kpi.append', rows_in=len(new_df)) as stage:
+                new_df = append_kpis(new_df, window_state)
+                stage['rows_out'] = len(new_df)
+            print(f"Incremental update: {len(new_df)} new rows for {new_df['Ticker'].nunique()} tickers.")
+            return pd.concat([existing_df, new_df], ignore_index=True), merged_extracts
+        print("New or revised months predate the materialized dataset, re-deriving their semesters.")
+
+    # CSV-derived rows of the touched semesters are dropped and de-accumulated again from the raw results
+    touched = _semester_keys(pd.concat([new_df, extracts[replaced]], ignore_index=True)).unique()
+    redo = merged_extracts[_semester_keys(merged_extracts).isin(touched)]
+    base = existing_df
+    if not existing_df.empty:
+        stale = extracts[_semester_keys(extracts).isin(touched)]
+        base = existing_df[~_row_keys(existing_df).isin(_row_keys(stale))]
+    with etl_stage('csv.deaccumulate', rows_in=len(redo)) as stage:
+        new_df = deaccumulate_semester_results(redo, base)
+        stage['rows_out'] = len(new_df)
+    # Combine
+    combined_df = pd.concat([base, new_df], ignore_index=True)
+    # Sort
+    combined_df = combined_df.sort_values(by=['Ticker', 'Date']).reset_index(drop=True)
+
+    # Re-calculate KPIs
+    with etl_stage('kpi.compute', rows_in=len(combined_df)) as stage:
+        combined_df = compute_kpis(combined_df)
+        stage['rows_out'] = len(combined_df)
+    return combined_df, merged_extracts
+
+
+def _signature(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _materialized_dir(cache_dir, full_universe=False):
+    return os.path.join(cache_dir, MATERIALIZED_DIR_NAME, 'full' if full_universe else 'listed')
+
+def load_materialized_dataset(cache_dir, excel_signature, full_universe=False):
+    """
+    Loads the dataset materialized by a previous incremental run for this universe mode
+    (dataset.parquet, window_state.parquet, extracts.parquet and dataset.json under
+    '<cache_dir>/materialized/<listed|full>/').
+    Returns (dataset_df, window_state, ingested_files, extracts) or None if missing, unreadable
+    or built from a different Balancetes_por_ticker.xlsx.
+    """
+    cache_dir = _materialized_dir(cache_dir, full_universe)
+    meta_path = os.path.join(cache_dir, MATERIALIZED_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
     try:
-        xl = pd.ExcelFile(file_path)
-        sheets = xl.sheet_names
-        print(f"Found {len(sheets)} banks (sheets): {sheets}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('excel') != excel_signature:
+            print("Historical workbook changed, rebuilding materialized dataset.")
+            return None
+        if not os.path.exists(os.path.join(cache_dir, MATERIALIZED_EXTRACTS_FILE)):
+            print("Materialized dataset has no CSV extracts, rebuilding it.")
+            return None
+        dataset_df = pd.read_parquet(os.path.join(cache_dir, MATERIALIZED_DATASET_FILE))
+        window_state = pd.read_parquet(os.path.join(cache_dir, MATERIALIZED_STATE_FILE))
+        extracts = pd.read_parquet(os.path.join(cache_dir, MATERIALIZED_EXTRACTS_FILE))
+        return dataset_df, window_state, meta.get('ingested', {}), extracts
     except Exception as e:
-        print(f"Error opening Excel file: {e}")
-        return pd.DataFrame()
+        print(f"Could not load materialized dataset: {e}")
+        return None
 
-    for ticker in sheets:
-        try:
-            # Load Sheet (which contains both Profit and Equity now)
-            df = pd.read_excel(file_path, sheet_name=ticker)
-            
-            # Helper to find column by substring
-            def find_col(df, keywords):
-                for col in df.columns:
-                    col_str = str(col).upper()
-                    if any(k in col_str for k in keywords):
-                        return col
-                return None
-
-            # Clean column names for safety? (Optional, but find_col handles the search)
-            # Find columns
-            col_date = find_col(df, ['DATA_BASE', 'DATABASE'])
-            col_profit = find_col(df, ['LUCRO', 'LUCRO LIQUIDO']) # Avoid 'LUCRO ACUMULADO' if 'LUCRO' matches strictly? 
-            # find_col returns first match. If 'LUCRO' comes before 'LUCRO ACUMULADO', likely fine.
-            # But strictly 'LUCRO' is better if present. Let's rely on substring 'LUCRO' but NOT 'ACUMULADO' if possible?
-            # Actually, the file has 'LUCRO' and 'LUCRO ACUMULADO'. 'LUCRO' is the monthly one.
-            # Only picking 'LUCRO' might be ambiguous if 'LUCRO ACUMULADO' is first.
-            # Let's be more specific.
-            col_profit = next((c for c in df.columns if str(c).upper().strip() == 'LUCRO'), None)
-            if not col_profit: # Fallback
-                 col_profit = find_col(df, ['LUCRO']) 
-            
-            col_equity = find_col(df, ['PATRIM', 'PATRIMONIO'])
+def save_materialized_dataset(cache_dir, dataset_df, excel_signature, ingested, full_universe=False, window_state=None,
+                              extracts=None):
+    """
+    Writes the dataset, its per-ticker window state (computed unless given), the raw CSV extracts
+    behind its CSV-derived rows (see _merge_extracts) and the metadata (workbook signature and
+    ingested CSV files) used by load_materialized_dataset, in this universe mode's directory.
+    Each file is written to a temporary name and moved into place, the metadata last, so an
+    interrupted save leaves the previous checkpoint readable. Returns True when saved.
+    """
+    if window_state is None:
+        window_state = kpi_window_state(dataset_df)
+    if extracts is None:
+        extracts = _empty_extracts()
+    cache_dir = _materialized_dir(cache_dir, full_universe)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        dataset_path = os.path.join(cache_dir, MATERIALIZED_DATASET_FILE)
+        state_path = os.path.join(cache_dir, MATERIALIZED_STATE_FILE)
+        extracts_path = os.path.join(cache_dir, MATERIALIZED_EXTRACTS_FILE)
+        meta_path = os.path.join(cache_dir, MATERIALIZED_META_FILE)
+        dataset_df.to_parquet(dataset_path + '.tmp', index=False)
+        window_state.to_parquet(state_path + '.tmp', index=False)
+        extracts.to_parquet(extracts_path + '.tmp', index=False)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'excel': excel_signature, 'ingested': ingested, 'full_universe': full_universe}, f)
+        os.replace(dataset_path + '.tmp', dataset_path)
+        os.replace(state_path + '.tmp', state_path)
+        os.replace(extracts_path + '.tmp', extracts_path)
+        os.replace(meta_path + '.tmp', meta_path)
+        return True
+    except Exception as e:
+        print(f"Could not save materialized dataset: {e}")
+        return False
 
-            if not all([col_date, col_profit, col_equity]):
-                print(f"Skipping {ticker}: Column mismatch.\nCols: {df.columns.tolist()}")
-                continue
+def _normalize_sheet(df, ticker):
+    """
+    Normalizes one workbook sheet to [Ticker, Date, MonthlyProfit, Equity] (None on column mismatch).
+    """
+    # Helper to find column by substring
+    def find_col(df, keywords):
+        for col in df.columns:
+            col_str = str(col).upper()
+            if any(k in col_str for k in keywords):
+                return col
+        return None
 
-            # Standardize
-            df = df.rename(columns={
-                col_date: 'Date',
-                col_profit: 'MonthlyProfit',
-                col_equity: 'Equity'
-            })
+    # Clean column names for safety? (Optional, but find_col handles the search)
+    # Find columns
+    col_date = find_col(df, ['DATA_BASE', 'DATABASE'])
+    col_profit = find_col(df, ['LUCRO', 'LUCRO LIQUIDO']) # Avoid 'LUCRO ACUMULADO' if 'LUCRO' matches strictly? 
+    # find_col returns first match. If 'LUCRO' comes before 'LUCRO ACUMULADO', likely fine.
+    # But strictly 'LUCRO' is better if present. Let's rely on substring 'LUCRO' but NOT 'ACUMULADO' if possible?
+    # Actually, the file has 'LUCRO' and 'LUCRO ACUMULADO'. 'LUCRO' is the monthly one.
+    # Only picking 'LUCRO' might be ambiguous if 'LUCRO ACUMULADO' is first.
+    # Let's be more specific.
+    col_profit = next((c for c in df.columns if str(c).upper().strip() == 'LUCRO'), None)
+    if not col_profit: # Fallback
+         col_profit = find_col(df, ['LUCRO']) 
+    
+    col_equity = find_col(df, ['PATRIM', 'PATRIMONIO'])
 
-            # Add Metadata
-            df['Ticker'] = ticker
-            
-            # Ensure numeric
-            df['MonthlyProfit'] = pd.to_numeric(df['MonthlyProfit'], errors='coerce').fillna(0)
-            df['Equity'] = pd.to_numeric(df['Equity'], errors='coerce').fillna(0)
-            
-            # Ensure Date
-            df['Date'] = df['Date'].astype(str)
-            df['Date'] = pd.to_datetime(df['Date'], format='%Y%m', errors='coerce')
-            df = df.sort_values(by='Date')
+    if not all([col_date, col_profit, col_equity]):
+        print(f"Skipping {ticker}: Column mismatch.\nCols: {df.columns.tolist()}")
+        return None
 
-            # --- CALCULATIONS ---
-            # Now we have longer history (2015+), so 12m metrics will be valid for more recent years.
-            
-            # Accumulated 12m Profit
-            df['Accumulated12mProfit'] = df['MonthlyProfit'].rolling(window=12, min_periods=12).sum()
-            
-            # SMA 12
-            df['MonthlyProfit_SMA12'] = df['MonthlyProfit'].rolling(window=12, min_periods=12).mean()
-            
-            # Projected ROE (3 months annualized)
-            # Formula: (Accumulated 3m Profit * 4) / Equity
-            df['Accumulated3mProfit'] = df['MonthlyProfit'].rolling(window=3, min_periods=3).sum()
-            df['ProjectedROE3m'] = df.apply(
-                lambda x: (x['Accumulated3mProfit'] * 4) / x['Equity'] if x['Equity'] != 0 and pd.notnull(x['Accumulated3mProfit']) else float('nan'), axis=1
-            )
-            
-            # Calculate ROE (Accumulated 12m Profit / Equity) -- LTM ROE
-            df['ROE'] = df.apply(
-                lambda x: x['Accumulated12mProfit'] / x['Equity'] if x['Equity'] != 0 else 0, axis=1
-            )
+    # Standardize
+    df = df.rename(columns={
+        col_date: 'Date',
+        col_profit: 'MonthlyProfit',
+        col_equity: 'Equity'
+    })
+
+    # Add Metadata
+    df['Ticker'] = ticker
+    
+    # Ensure numeric
+    df['MonthlyProfit'] = pd.to_numeric(df['MonthlyProfit'], errors='coerce').fillna(0)
+    df['Equity'] = pd.to_numeric(df['Equity'], errors='coerce').fillna(0)
+    
+    # Ensure Date
+    df['Date'] = df['Date'].astype(str)
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y%m', errors='coerce')
+    df = df.sort_values(by='Date')
+
+    return df[['Ticker', 'Date', 'MonthlyProfit', 'Equity']]
 
-            all_data.append(df[['Ticker', 'Date', 'MonthlyProfit', 'Equity', 'Accumulated12mProfit', 'MonthlyProfit_SMA12', 'ProjectedROE3m', 'ROE']])
+@instrumented('read_historical_workbook')
+def read_historical_workbook(file_path, use_snapshot=True):
+    """
+    Reads every sheet (Ticker) of 'Balancetes_por_ticker.xlsx' in a single pass over the open
+    workbook and returns the normalized [Ticker, Date, MonthlyProfit, Equity] frame.
+    The result is kept as a Parquet snapshot next to the workbook
+    ('<name>.snapshot.parquet' + '.snapshot.json') and reused until the workbook's size or mtime
+    changes. Returns None if the workbook cannot be opened.
+    """
+    base = os.path.splitext(file_path)[0]
+    snapshot_path = base + '.snapshot.parquet'
+    snapshot_meta_path = base + '.snapshot.json'
+    signature = _signature(file_path)
+
+    if use_snapshot and os.path.exists(snapshot_path) and os.path.exists(snapshot_meta_path):
+        try:
+            with open(snapshot_meta_path, 'r', encoding='utf-8') as f:
+                if json.load(f) == signature:
+                    with etl_stage('excel.snapshot') as stage:
+                        df_excel = pd.read_parquet(snapshot_path)
+                        stage['rows_out'] = len(df_excel)
+                    print(f"Loaded workbook snapshot: {len(df_excel)} records.")
+                    return df_excel
+        except Exception as e:
+            print(f"Ignoring workbook snapshot: {e}")
+
+    try:
+        with etl_stage('excel.parse') as stage, pd.ExcelFile(file_path) as xl:
+            print(f"Found {len(xl.sheet_names)} banks (sheets): {xl.sheet_names}")
+            # Load all sheets (which contain both Profit and Equity now) in one pass
+            sheets = pd.read_excel(xl, sheet_name=None)
+            stage['rows_out'] = sum(len(sheet) for sheet in sheets.values())
+    except Exception as e:
+        print(f"Error opening Excel file: {e}")
+        return None
+
+    all_data = []
+    for ticker, df in sheets.items():
+        try:
+            df = _normalize_sheet(df, ticker)
+            if df is None:
+                continue
+            all_data.append(df)
             print(f"Loaded {ticker}: {len(df)} records. Date Range: {df['Date'].min()} to {df['Date'].max()}")
         except Exception as e:
             print(f"Error processing {ticker}: {e}")
@@ -261,19 +922,589 @@ def load_initial_data(directory):
     else:
         df_excel = pd.DataFrame(columns=['Ticker', 'Date', 'MonthlyProfit', 'Equity'])
 
+    if use_snapshot:
+        try:
+            df_excel.to_parquet(snapshot_path, index=False)
+            with open(snapshot_meta_path, 'w', encoding='utf-8') as f:
+                json.dump(signature, f)
+        except Exception as e:
+            print(f"Could not write workbook snapshot: {e}")
+
+    return df_excel
+
+def dataset_version(directory):
+    """
+    Content version of the historical sources behind load_initial_data(directory): the workbook
+    plus every monthly balancete in the parent directory, from names, sizes and mtimes (stat
+    only, no reads). Changes whenever a source file is added, removed or modified.
+    """
+    root_dir = os.path.dirname(directory)
+    sources = [os.path.join(directory, 'Balancetes_por_ticker.xlsx')]
+    if os.path.isdir(root_dir):
+        sources += find_balancete_files(root_dir)
+
+    sha = hashlib.sha1()
+    for path in sources:
+        if os.path.exists(path):
+            sig = _signature(path)
+            sha.update(f"{os.path.basename(path)}:{sig['size']}:{sig['mtime_ns']};".encode('utf-8'))
+    return sha.hexdigest()[:16]
+
+def _workbook_signature(file_path):
+    # None when the legacy workbook is absent (CSV-only history)
+    return _signature(file_path) if os.path.exists(file_path) else None
+
+def _workbook_seed(file_path, use_cache=True):
+    """
+    Seed history from the legacy workbook with its KPIs computed; an empty frame when the
+    workbook does not exist, None when it cannot be read.
+    """
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}, using the monthly balancetes only.")
+        return compute_kpis(pd.DataFrame({'Ticker': pd.Series(dtype=str), 'Date': pd.Series(dtype='datetime64[ns]'),
+                                          'MonthlyProfit': pd.Series(dtype=float), 'Equity': pd.Series(dtype=float)}))
+
+    df_excel = read_historical_workbook(file_path, use_snapshot=use_cache)
+    if df_excel is None or df_excel.empty:
+        return df_excel
+
+    # --- CALCULATIONS ---
+    # Now we have longer history (2015+), so 12m metrics will be valid for more recent years.
+    with etl_stage('kpi.compute', rows_in=len(df_excel)) as stage:
+        df_excel = compute_kpis(df_excel)
+        stage['rows_out'] = len(df_excel)
+    return df_excel
+
+@instrumented('load_initial_data')
+def load_initial_data(directory, incremental=False, workers=None, use_cache=True, full_universe=False):
+    """
+    Loads data from the single historical file 'Balancetes_por_ticker.xlsx'.
+    Iterates through sheets (Ticker) and extracts Profit/Equity.
+    Returns a single consolidated DataFrame.
+    The workbook is only a legacy seed: without it the history comes from the monthly
+    balancetes alone (see backfill_history).
+    incremental=True keeps the final dataset materialized under the CSV cache directory (one
+    checkpoint per universe mode, see load_materialized_dataset) and, while the workbook is
+    unchanged, only ingests CSV files not seen before or changed since (see load_csv_data);
+    files that fail to parse are retried on the next call.
+    workers is forwarded to load_csv_data (process-parallel CSV parsing).
+    use_cache=False bypasses the workbook snapshot and the CSV Parquet cache.
+    full_universe=True adds every institution found in the monthly CSVs (keyed by CNPJ root
+    unless mapped to a ticker); the workbook still only covers the listed banks.
+    """
+    # Path to the new consolidated file
+    file_path = os.path.join(directory, 'Balancetes_por_ticker.xlsx')
+
+    root_dir = os.path.dirname(directory) # CSVs live in the parent of 'historical'
+    if incremental:
+        cache_dir = os.path.join(root_dir, CACHE_DIR_NAME)
+        excel_signature = _workbook_signature(file_path)
+        csv_files = find_balancete_files(root_dir)
+        current = {os.path.basename(f): _signature(f) for f in csv_files}
+        materialized = load_materialized_dataset(cache_dir, excel_signature, full_universe)
+        if materialized is not None:
+            dataset_df, window_state, ingested, extracts = materialized
+            pending = [f for f in csv_files if ingested.get(os.path.basename(f)) != current[os.path.basename(f)]]
+            if not pending:
+                print(f"Materialized dataset is up to date ({len(dataset_df)} rows).")
+                return dataset_df
+            df_final, extracts, applied = _ingest_csv_files(
+                root_dir, dataset_df, use_cache=use_cache, window_state=window_state, files=pending, workers=workers,
+                full_universe=full_universe, extracts=extracts)
+            # Only files whose rows were applied are signed off
+            ingested = {name: sig for name, sig in ingested.items() if name in current}
+            ingested.update({os.path.basename(f): current[os.path.basename(f)] for f in applied})
+            save_materialized_dataset(cache_dir, df_final, excel_signature, ingested, full_universe, extracts=extracts)
+            return df_final
+
+    df_excel = _workbook_seed(file_path, use_cache)
+    if df_excel is None:
+        return pd.DataFrame()
+
     # 2. Check for CSVs and Merge
     # We pass the Excel DF to the CSV loader
     # The CSV loader manages finding files in the ROOT directory (parent of historical?)
     # Based on user context, CSVs are in 'c:\D\Python\Balancetes', so 'directory' arg might need adjustment.
     # passed directory is '.../historical'. Parent is '.../Balancetes'.
     
-    root_dir = os.path.dirname(directory) # Go up one level
-    df_final = load_csv_data(root_dir, df_excel)
-    
-    return df_final
+    df_final, extracts, applied = _ingest_csv_files(root_dir, df_excel, use_cache=use_cache, workers=workers,
+                                                    full_universe=full_universe)
+    if incremental:
+        ingested = {os.path.basename(f): current[os.path.basename(f)] for f in applied}
+        save_materialized_dataset(cache_dir, df_final, excel_signature, ingested, full_universe, extracts=extracts)
 
     return df_final
 
+def backfill_history(directory, workers=None, full_universe=False, use_cache=True, limit=None):
+    """
+    Resumable bulk load of every monthly balancete (plain or zipped) next to directory, oldest
+    first, into the materialized dataset used by load_initial_data(incremental=True).
+    The workbook, when present, only seeds the history. After each month the dataset, window
+    state and ingested-file list are checkpointed (see save_materialized_dataset), so an
+    interrupted run resumes after the last committed month; files already ingested with the
+    same size and mtime are skipped. Months that failed are retried on the next run and
+    re-published files are applied again, re-deriving their semesters (see _merge_extracts).
+    Prints one progress line per month with the throughput.
+    workers > 1 parses ahead in that many processes; limit stops after that many months.
+    Returns a summary dict: months, failed (file names), rows, seconds, months_per_s.
+    """
+    root_dir = os.path.dirname(directory)
+    cache_dir = os.path.join(root_dir, CACHE_DIR_NAME)
+    file_path = os.path.join(directory, 'Balancetes_por_ticker.xlsx')
+    excel_signature = _workbook_signature(file_path)
+
+    csv_files = find_balancete_files(root_dir) if os.path.isdir(root_dir) else []
+    materialized = load_materialized_dataset(cache_dir, excel_signature, full_universe)
+    if materialized is not None:
+        dataset_df, window_state, ingested, extracts = materialized
+        print(f"Resuming from checkpoint: {len(ingested)} months, {len(dataset_df)} rows.")
+    else:
+        dataset_df = _workbook_seed(file_path, use_cache)
+        if dataset_df is None:
+            return None
+        window_state = kpi_window_state(dataset_df)
+        ingested = {}
+        extracts = _empty_extracts()
+        # The seed is the first checkpoint
+        save_materialized_dataset(cache_dir, dataset_df, excel_signature, ingested, full_universe, window_state,
+                                  extracts)
+
+    pending = [f for f in csv_files if ingested.get(os.path.basename(f)) != _signature(f)]
+    if limit is not None:
+        pending = pending[:limit]
+    print(f"Backfill: {len(csv_files)} monthly files, {len(csv_files) - len(pending)} committed, "
+          f"{len(pending)} to ingest.")
+
+    failed = []
+    start = time.perf_counter()
+    for done, (path, month_df) in enumerate(
+            _extract_files(pending, cache_dir if use_cache else None, workers, full_universe), 1):
+        name = os.path.basename(path)
+        if month_df is None:
+            # Not signed off, so the next run retries it (later months of its semester are re-derived then)
+            failed.append(name)
+            status = 'failed'
+        else:
+            rows_before = len(dataset_df)
+            with etl_stage('backfill.month', rows_in=len(month_df), file=name) as stage:
+                dataset_df, extracts = _merge_extracts(dataset_df, [month_df], window_state, extracts)
+                window_state = kpi_window_state(dataset_df)
+                ingested[name] = _signature(path)
+                if not save_materialized_dataset(cache_dir, dataset_df, excel_signature, ingested, full_universe,
+                                                 window_state, extracts):
+                    return None
+                stage['rows_out'] = len(dataset_df) - rows_before
+            status = f"+{len(dataset_df) - rows_before} rows"
+
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed else float('inf')
+        eta = (len(pending) - done) / rate if rate else 0
+        print(f"[{done}/{len(pending)}] {name}: {status} | {rate:.2f} months/s | ETA {eta:.0f}s")
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'months': len(pending) - len(failed),
+        'failed': failed,
+        'rows': len(dataset_df),
+        'seconds': elapsed,
+        'months_per_s': len(pending) / elapsed if elapsed else 0.0
+    }
+    print(f"Backfill done: {summary['months']} months in {elapsed:.1f}s ({summary['months_per_s']:.2f} months/s), "
+          f"{summary['rows']} rows, {len(failed)} failed.")
+    return summary
+
+def _artifact_root(cache_dir, full_universe=False):
+    return os.path.join(cache_dir, ARTIFACTS_DIR_NAME, 'full' if full_universe else 'listed')
+
+def _current_version(root):
+    # Version named by root/CURRENT (see _publish_version), or None
+    try:
+        with open(os.path.join(root, ARTIFACT_CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _staging_dir(root, version):
+    # Empty temporary directory next to the published versions, moved into place by _publish_version
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = os.path.join(root, f".{version}.tmp{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+def _publish_version(root, tmp_dir, version, keep):
+    """
+    Moves a completely written tmp_dir (see _staging_dir) to '<root>/<version>' and rewrites
+    CURRENT last, so readers never see a partial version. Then prunes older versions (by build
+    time, never the one just published) down to the keep most recent; processes that still map
+    a pruned version keep its pages until they reopen.
+    """
+    final_dir = os.path.join(root, version)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    current_path = os.path.join(root, ARTIFACT_CURRENT_FILE)
+    with open(current_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(current_path + '.tmp', current_path)
+
+    versions = [d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)) and not d.startswith('.')]
+    versions.sort(key=lambda d: os.path.getmtime(os.path.join(root, d)), reverse=True)
+    for old in [d for d in versions if d != version][max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+def current_artifact_version(cache_dir, full_universe=False):
+    """
+    Version of the artifact currently published under cache_dir (see build_artifact), or None.
+    """
+    return _current_version(_artifact_root(cache_dir, full_universe))
+
+def build_artifact(directory, cache_dir=None, full_universe=False, workers=None, incremental=False, keep=3, force=False):
+    """
+    Headless build of everything the dashboard needs from the historical sources of
+    load_initial_data(directory): the KPI dataset and the latest-snapshot table, written as
+    uncompressed Arrow IPC files under '<cache_dir>/artifacts/<listed|full>/<version>/' with a
+    manifest.json. version is dataset_version(directory), so an unchanged source tree is
+    skipped unless force=True. The new version is published by rewriting CURRENT last (readers
+    never see a partial artifact); only the keep most recent versions are kept.
+    Returns the manifest, or None when no data could be loaded.
+    """
+    import pyarrow.feather as feather
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(directory), CACHE_DIR_NAME)
+    root = _artifact_root(cache_dir, full_universe)
+    version = dataset_version(directory)
+
+    manifest = artifact_manifest(cache_dir, full_universe)
+    if not force and manifest and manifest.get('version') == version and manifest.get('format') == ARTIFACT_FORMAT:
+        print(f"Artifact {version} is up to date.")
+        return manifest
+
+    df = load_initial_data(directory, incremental=incremental, workers=workers, full_universe=full_universe)
+    if df.empty:
+        print("No data loaded, artifact not written.")
+        return None
+
+    with etl_stage('artifact.snapshot', rows_in=len(df)) as stage:
+        snapshot_df = compute_latest_snapshot(df)
+        stage['rows_out'] = len(snapshot_df)
+
+    # Stored partition-ready (sorted by Ticker, Date): each bank is one contiguous row range
+    df = _partition_frame(df)
+    sizes = df.groupby('Ticker', sort=False).size()
+    starts = sizes.cumsum() - sizes
+    partitions = {ticker: [int(starts[ticker]), int(sizes[ticker])] for ticker in sizes.index}
+
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'version': version,
+        'built_at': time.time(),
+        'full_universe': full_universe,
+        'rows': len(df),
+        'tickers': int(df['Ticker'].nunique()),
+        'first_date': str(df['Date'].min().date()),
+        'last_date': str(df['Date'].max().date()),
+        'snapshot_rows': len(snapshot_df),
+        # Row range [start, length] of each ticker in dataset.arrow
+        'partitions': partitions,
+        # Display names for CNPJ-keyed institutions, so the app never has to open a CSV for them
+        'institution_names': institution_names(os.path.dirname(directory)) if full_universe else {}
+    }
+
+    # Written to a temporary directory first, then moved into place
+    tmp_dir = _staging_dir(root, version)
+    with etl_stage('artifact.write', rows_in=len(df)):
+        # Uncompressed so the app can memory-map the columns instead of decoding them
+        feather.write_feather(df, os.path.join(tmp_dir, ARTIFACT_DATASET_FILE),
+                              compression='uncompressed')
+        feather.write_feather(snapshot_df.reset_index(drop=True), os.path.join(tmp_dir, ARTIFACT_SNAPSHOT_FILE),
+                              compression='uncompressed')
+        with open(os.path.join(tmp_dir, ARTIFACT_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    _publish_version(root, tmp_dir, version, keep)
+    print(f"Published artifact {version}: {manifest['rows']} rows, {manifest['tickers']} tickers.")
+    return manifest
+
+def artifact_manifest(cache_dir, full_universe=False, version=None):
+    """
+    manifest.json of a published artifact (default: the CURRENT one), or None.
+    """
+    version = version or current_artifact_version(cache_dir, full_universe)
+    if not version:
+        return None
+    try:
+        with open(os.path.join(_artifact_root(cache_dir, full_universe), version, ARTIFACT_MANIFEST_FILE),
+                  'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _artifact_table(cache_dir, full_universe, version, name):
+    # Memory-mapped Arrow table (zero-copy: pages are read on access), or None with the reason printed
+    import pyarrow as pa
+
+    manifest = artifact_manifest(cache_dir, full_universe, version)
+    if manifest is None or manifest.get('format') != ARTIFACT_FORMAT:
+        return None, None
+    path = os.path.join(_artifact_root(cache_dir, full_universe), manifest['version'], name)
+    try:
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all(), manifest
+    except Exception as e:
+        print(f"Could not read artifact {manifest['version']}/{name}: {e}")
+        return None, None
+
+def load_artifact(cache_dir, full_universe=False, version=None):
+    """
+    Memory-maps a precomputed artifact (default: the CURRENT one) and returns
+    (dataset_df, snapshot_df, manifest), or None when there is no usable artifact.
+    """
+    with etl_stage('artifact.load') as stage:
+        dataset, manifest = _artifact_table(cache_dir, full_universe, version, ARTIFACT_DATASET_FILE)
+        snapshot_df = load_artifact_snapshot(cache_dir, full_universe, version)
+        if dataset is None or snapshot_df is None:
+            return None
+        dataset_df = dataset.to_pandas().drop(columns=['Profit_Var', 'Equity_Var'])
+        stage['rows_out'] = len(dataset_df)
+    return dataset_df, snapshot_df, manifest
+
+def load_artifact_snapshot(cache_dir, full_universe=False, version=None):
+    """
+    Only the latest-snapshot table of an artifact (see compute_latest_snapshot), or None.
+    """
+    table, _ = _artifact_table(cache_dir, full_universe, version, ARTIFACT_SNAPSHOT_FILE)
+    return None if table is None else table.to_pandas()
+
+def load_artifact_partition(cache_dir, ticker, full_universe=False, version=None):
+    """
+    One ticker's rows of an artifact, as partition_by_ticker would return them (sorted by Date,
+    with Profit_Var / Equity_Var). Reads a single row range of the memory-mapped dataset.
+    Returns None without an artifact, an empty frame for an unknown ticker.
+    """
+    with etl_stage('artifact.partition', ticker=ticker) as stage:
+        table, manifest = _artifact_table(cache_dir, full_universe, version, ARTIFACT_DATASET_FILE)
+        if table is None:
+            return None
+        start, length = manifest['partitions'].get(ticker, (0, 0))
+        part = table.slice(start, length).to_pandas()
+        stage['rows_out'] = len(part)
+    return part
+
+def _account_store_index(store_dir):
+    try:
+        with open(os.path.join(store_dir, ACCOUNT_STORE_INDEX_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def ingest_account_store(directory, cache_dir=None, files=None, force=False, name_to_ticker=None):
+    """
+    Ingests every line of the monthly balancetes in directory (all institutions, all accounts)
+    into the full-account store: '<cache_dir>/accounts/month=YYYYMM/data.parquet' with
+    [Ticker, CNPJ, NOME_INSTITUICAO, CONTA, NOME_CONTA, SALDO], Ticker keyed as in full-universe
+    mode (see institution_keys). One month is in memory at a time; months whose source file
+    (name, size, mtime) is already in index.json are skipped unless force=True.
+    Returns the number of months written.
+    """
+    if name_to_ticker is None:
+        name_to_ticker = NAME_TO_TICKER
+    if cache_dir is None:
+        cache_dir = os.path.join(directory, CACHE_DIR_NAME)
+    store_dir = os.path.join(cache_dir, ACCOUNT_STORE_DIR_NAME)
+    csv_files = find_balancete_files(directory) if files is None else files
+    index = _account_store_index(store_dir)
+
+    written = 0
+    for file_path in csv_files:
+        name = os.path.basename(file_path)
+        signature = _signature(file_path)
+        entry = index.get(name)
+        if not force and entry and {k: entry.get(k) for k in signature} == signature:
+            continue
+
+        try:
+            with etl_stage('store.ingest', file=name) as stage:
+                df = read_balancete(file_path, cache_dir)
+                month = balancete_month(df)
+                if month is None:
+                    continue
+                keys = institution_keys(df, name_to_ticker)
+                names = df['NOME_INSTITUICAO'].astype(str)
+                month_df = pd.DataFrame({
+                    'Ticker': keys.reindex(names).values,
+                    'CNPJ': df['CNPJ'].astype('int64'),
+                    'NOME_INSTITUICAO': df['NOME_INSTITUICAO'],
+                    'CONTA': df['CONTA'].astype('int64'),
+                    'NOME_CONTA': df['NOME_CONTA'],
+                    'SALDO': df['SALDO']
+                }).sort_values(by=['Ticker', 'CONTA'], kind='mergesort')
+
+                part_dir = os.path.join(store_dir, f"month={month}")
+                os.makedirs(part_dir, exist_ok=True)
+                tmp_path = os.path.join(part_dir, 'data.parquet.tmp')
+                month_df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, os.path.join(part_dir, 'data.parquet'))
+                stage['rows_out'] = len(month_df)
+        except Exception as e:
+            print(f"Could not ingest {name} into the account store: {e}")
+            continue
+
+        # Index updated after every month, so an interrupted run keeps what it wrote
+        index[name] = {**signature, 'month': month}
+        tmp_index = os.path.join(store_dir, ACCOUNT_STORE_INDEX_FILE + '.tmp')
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_index, os.path.join(store_dir, ACCOUNT_STORE_INDEX_FILE))
+        written += 1
+        print(f"Account store: {name} -> month={month} ({len(month_df)} lines)")
+
+    return written
+
+def _account_store_files(store_dir):
+    # Committed month partitions only (no leftover .tmp files)
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(os.path.join(store_dir, d, 'data.parquet') for d in os.listdir(store_dir)
+                  if d.startswith('month=') and os.path.exists(os.path.join(store_dir, d, 'data.parquet')))
+
+def build_account_series(cache_dir, force=False, keep=2):
+    """
+    Consolidates the full-account store (see ingest_account_store) into 'series.arrow', one
+    uncompressed Arrow IPC record batch [Ticker, CONTA, month, SALDO] sorted by (Ticker, CONTA, month),
+    and 'index.arrow' with the [start, length] row range of every (Ticker, CONTA) series.
+    Versioned by the store's index.json under '<cache_dir>/account_series/<version>/'; CURRENT is
+    rewritten last and only the keep most recent versions are kept. An unchanged store is skipped
+    unless force=True. Returns the published version, or None when the store is empty.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.feather as feather
+
+    store_dir = os.path.join(cache_dir, ACCOUNT_STORE_DIR_NAME)
+    files = _account_store_files(store_dir)
+    if not files:
+        print(f"Account store is empty: {store_dir}")
+        return None
+
+    with open(os.path.join(store_dir, ACCOUNT_STORE_INDEX_FILE), 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:16]
+    root = os.path.join(cache_dir, ACCOUNT_SERIES_DIR_NAME)
+    if not force and _current_version(root) == version:
+        return version
+
+    with etl_stage('series.build') as stage:
+        dataset = ds.dataset(files, format='parquet', partitioning=ds.partitioning(flavor='hive'),
+                             partition_base_dir=store_dir)
+        table = dataset.to_table(columns=['Ticker', 'CONTA', 'month', 'SALDO'])
+        table = table.set_column(0, 'Ticker', pc.cast(table['Ticker'], pa.string()))
+        # One contiguous batch: every series slice is a single zero-copy buffer range
+        table = table.sort_by([('Ticker', 'ascending'), ('CONTA', 'ascending'), ('month', 'ascending')]).combine_chunks()
+
+        # Series boundaries of the sorted keys
+        keys = table.select(['Ticker', 'CONTA']).to_pandas()
+        is_start = (keys['Ticker'].ne(keys['Ticker'].shift()) | keys['CONTA'].ne(keys['CONTA'].shift())).to_numpy()
+        starts = np.flatnonzero(is_start)
+        index = pd.DataFrame({
+            'Ticker': keys['Ticker'].to_numpy()[starts],
+            'CONTA': keys['CONTA'].to_numpy()[starts],
+            'start': starts,
+            'length': np.diff(np.append(starts, len(keys)))
+        })
+
+        tmp_dir = _staging_dir(root, version)
+        with pa.OSFile(os.path.join(tmp_dir, ACCOUNT_SERIES_FILE), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(len(table), 1))
+        feather.write_feather(index, os.path.join(tmp_dir, ACCOUNT_SERIES_INDEX_FILE), compression='uncompressed')
+        stage['rows_out'] = len(table)
+
+    _publish_version(root, tmp_dir, version, keep)
+    print(f"Published account series {version}: {len(table)} rows, {len(index)} series.")
+    return version
+
+# Memory-mapped account series per cache_dir: (version, table, offset index), reopened after a rebuild
+_account_series_handles = {}
+_account_series_lock = threading.Lock()
+
+def open_account_series(cache_dir):
+    """
+    Memory-maps the CURRENT account-series store (see build_account_series) once per process
+    and returns (table, offsets): the Arrow table and a dict (Ticker, CONTA) -> (start, length).
+    Pages come from the OS page cache, so worker processes mapping the same file share one
+    physical copy. Returns None when no store has been built.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    root = os.path.join(cache_dir, ACCOUNT_SERIES_DIR_NAME)
+    version = _current_version(root)
+    if version is None:
+        return None
+
+    with _account_series_lock:
+        cached = _account_series_handles.get(cache_dir)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        try:
+            table = pa.ipc.open_file(pa.memory_map(os.path.join(root, version, ACCOUNT_SERIES_FILE), 'r')).read_all()
+            index = feather.read_table(os.path.join(root, version, ACCOUNT_SERIES_INDEX_FILE)).to_pandas()
+        except Exception as e:
+            print(f"Could not open account series {version}: {e}")
+            return None
+        offsets = dict(zip(zip(index['Ticker'], index['CONTA'].tolist()),
+                           zip(index['start'].tolist(), index['length'].tolist())))
+        _account_series_handles[cache_dir] = (version, table, offsets)
+        return table, offsets
+
+def account_series(cache_dir, ticker, account, as_arrow=False):
+    """
+    Monthly balances of one account for one institution (Ticker as in full-universe mode):
+    [month, SALDO] sorted by month. The rows are a zero-copy slice of the memory-mapped store;
+    as_arrow=True returns that Arrow table as is, otherwise a (small) DataFrame.
+    Empty for an unknown pair, None when no store has been built.
+    """
+    handle = open_account_series(cache_dir)
+    if handle is None:
+        return None
+    table, offsets = handle
+    start, length = offsets.get((ticker, int(account)), (0, 0))
+    rows = table.slice(start, length).select(['month', 'SALDO'])
+    return rows if as_arrow else rows.to_pandas()
+
+def query_account_store(sql, cache_dir):
+    """
+    Runs SQL over the full-account store in an in-process DuckDB connection and returns a
+    DataFrame. The store is the view 'balancetes' with columns
+    [month (YYYYMM), Ticker, CNPJ, NOME_INSTITUICAO, CONTA, NOME_CONTA, SALDO]; filters on month
+    only read the matching partitions. Needs the optional duckdb package; returns an empty
+    DataFrame (after printing why) when it is missing, the store is empty or the query fails.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        print("Querying the account store needs DuckDB (pip install duckdb).")
+        return pd.DataFrame()
+
+    store_dir = os.path.join(cache_dir, ACCOUNT_STORE_DIR_NAME)
+    if not os.path.isdir(store_dir) or not any(d.startswith('month=') for d in os.listdir(store_dir)):
+        print(f"Account store is empty: {store_dir}")
+        return pd.DataFrame()
+
+    pattern = os.path.join(store_dir, 'month=*', 'data.parquet').replace("'", "''")
+    try:
+        with etl_stage('store.query') as stage, duckdb.connect() as con:
+            con.execute(f"CREATE VIEW {ACCOUNT_STORE_VIEW} AS "
+                        f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+            result = con.execute(sql).df()
+            stage['rows_out'] = len(result)
+        return result
+    except Exception as e:
+        print(f"Account store query failed: {e}")
+        return pd.DataFrame()
+
 def load_valuation_data(directory):
     """
     Loads valuation data from 'multiplos.xlsx'.
@@ -310,18 +1541,9 @@ def load_valuation_data(directory):
         # Clean Data
         df = df.dropna(subset=['Ticker'])
         
-        def clean_float(x):
-            if isinstance(x, str):
-                x = x.replace('.', '').replace(',', '.')
-                if '%' in x:
-                    x = x.replace('%', '')
-                    return float(x) / 100
-                return float(x)
-            return x
-            
-        df['Price'] = df['Price'].apply(clean_float)
-        df['P/L'] = df['P/L'].apply(clean_float)
-        df['DY'] = df['DY'].apply(clean_float)
+        # pt-BR text ('108,93', '5,54%') parsed column-wise; numeric Excel cells pass through
+        for col in ['Price', 'P/L', 'DY']:
+            df[col] = parse_br_numbers(df[col])
         
         # Normalize Ticker (First 4 chars)
         df['Ticker'] = df['Ticker'].astype(str).str.strip().str[:4]
@@ -335,21 +1557,20 @@ def load_valuation_data(directory):
         print(f"Error loading valuation data: {e}")
         return pd.DataFrame()
 
-def load_fundamentus_data():
+def load_fundamentus_data(url=FUNDAMENTUS_URL, timeout=10):
     """
-    Scrapes valuation data from 'www.fundamentus.com.br'.
+    Scrapes valuation data from 'www.fundamentus.com.br' (url can point to a stand-in server).
     Returns DataFrame with columns: [Ticker, Price, P/L, DY]
     """
     import requests
     import io
     
-    url = "https://www.fundamentus.com.br/resultado.php"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = requests.get(url, headers=headers, timeout=timeout)
         response.raise_for_status()
         
         # Parse table using pandas
@@ -382,33 +1603,11 @@ def load_fundamentus_data():
         df = df[list(rename_map.values())].copy()
         
         # Data Cleaning
-        def clean_percentage(x):
-            if isinstance(x, str):
-                x = x.replace('%', '').replace('.', '').replace(',', '.')
-                return float(x) / 100
-            if isinstance(x, (int, float)):
-                return float(x) / 100 # Fundamentus usually returns % as string, but if pandas parsed it as float (e.g. 5.0 for 5%), we might need diving. 
-                # Actually read_html(decimal=',') handles numbers well, but % often remains string.
-                # Let's inspect typical behavior: '6,67%' -> string. 
-            return x
-
-        # Price and P/L should be floats already due to read_html(decimal=','), but let's ensure
-        # Sometimes read_html might miss if there are weird chars. 
-        # Fundamental: 'Cotação' matches 1000 with user locale? Yes.
-        
-        # Handle simple numeric conversions just in case
+        # read_html(decimal=',', thousands='.') already parses plain numbers; whatever stays text
+        # (e.g. Div.Yield '6,75%') goes through the same vectorized parser. DY is always a percentage.
         for col in ['Price', 'P/L']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-        # Handle Percentage for DY
-        # Fundamentus sends 'Div.Yield' as '6,00%'. pd.read_html might not strip %.
-        # If it is object type, we clean.
-        if df['DY'].dtype == 'object':
-             df['DY'] = df['DY'].apply(clean_percentage)
-        else:
-             # If it parsed as float (unlikely with %), check scale. 
-             # Usually request returns string "6,75%".
-             pass
+            df[col] = parse_br_numbers(df[col])
+        df['DY'] = parse_br_numbers(df['DY'], percent=True)
              
         # Normalize Ticker (First 4 chars)
         # e.g. ITUB4 -> ITUB
@@ -424,6 +1623,106 @@ def load_fundamentus_data():
         print(f"Error scraping Fundamentus: {e}")
         return pd.DataFrame()
 
+def _valuation_cache_paths(cache_dir):
+    snapshot_path = os.path.join(cache_dir, VALUATION_CACHE_FILE)
+    return snapshot_path, os.path.splitext(snapshot_path)[0] + '.json'
+
+def valuation_snapshot_version(cache_dir):
+    """
+    Version of the valuation snapshot on disk (mtime of its metadata, written last), or None
+    when there is none yet. Changes whenever new quotes are written.
+    """
+    try:
+        return os.stat(_valuation_cache_paths(cache_dir)[1]).st_mtime_ns
+    except OSError:
+        return None
+
+def load_valuation_snapshot(cache_dir, ttl_seconds=VALUATION_TTL_SECONDS):
+    """
+    Reads the last good valuation snapshot written by load_cached_valuation, without any
+    HTTP request. Returns (val_df, status) like load_cached_valuation; status['stale'] is True
+    when the snapshot is older than ttl_seconds. val_df is empty if there is no snapshot yet.
+    """
+    snapshot_path, meta_path = _valuation_cache_paths(cache_dir)
+    if os.path.exists(snapshot_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                fetched_at = json.load(f)['fetched_at']
+            val_df = pd.read_parquet(snapshot_path)
+            stale = time.time() - fetched_at >= ttl_seconds
+            return val_df, {'fetched_at': fetched_at, 'stale': stale, 'source': 'cache'}
+        except Exception as e:
+            print(f"Ignoring valuation cache: {e}")
+    return pd.DataFrame(), {'fetched_at': None, 'stale': True, 'source': 'none'}
+
+def load_cached_valuation(cache_dir, ttl_seconds=VALUATION_TTL_SECONDS, url=FUNDAMENTUS_URL, timeout=10):
+    """
+    Disk-backed TTL cache around load_fundamentus_data ('fundamentus.parquet' + '.json' in cache_dir).
+    - snapshot younger than ttl_seconds -> served directly, no HTTP request
+    - otherwise fetched live; a successful fetch replaces the snapshot
+    - fetch fails, times out or returns nothing -> last snapshot is served, marked stale
+    Returns (val_df, status) with status = {'fetched_at': epoch seconds or None, 'stale': bool,
+    'source': 'cache' | 'live' | 'none'}.
+    """
+    cached_df, status = load_valuation_snapshot(cache_dir, ttl_seconds)
+    if not cached_df.empty and not status['stale']:
+        return cached_df, status
+
+    live_df = load_fundamentus_data(url=url, timeout=timeout)
+    if not live_df.empty:
+        fetched_at = time.time()
+        snapshot_path, meta_path = _valuation_cache_paths(cache_dir)
+        # Temporary names unique per writer: the refresher thread and a manual refresh may overlap
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            live_df.to_parquet(snapshot_path + suffix, index=False)
+            os.replace(snapshot_path + suffix, snapshot_path)
+            with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+                json.dump({'fetched_at': fetched_at, 'url': url}, f)
+            os.replace(meta_path + suffix, meta_path)
+        except Exception as e:
+            print(f"Could not write valuation cache: {e}")
+        return live_df, {'fetched_at': fetched_at, 'stale': False, 'source': 'live'}
+
+    if not cached_df.empty:
+        print("Live valuation fetch failed, serving stale snapshot.")
+        return cached_df, status
+
+    return live_df, {'fetched_at': None, 'stale': True, 'source': 'none'}
+
+# Background refreshers already running, by cache_dir
+_valuation_refreshers = {}
+_valuation_refreshers_lock = threading.Lock()
+
+def start_valuation_refresher(cache_dir, interval_seconds=VALUATION_TTL_SECONDS, url=FUNDAMENTUS_URL, timeout=10):
+    """
+    Starts (once per cache_dir and process) a daemon thread that keeps the valuation snapshot
+    fresh: right away and then every interval_seconds it runs load_cached_valuation, which only
+    goes to the network once the snapshot is older than the TTL. Readers use
+    load_valuation_snapshot and never wait on HTTP.
+    Returns the threading.Event that stops the thread when set.
+    """
+    with _valuation_refreshers_lock:
+        running = _valuation_refreshers.get(cache_dir)
+        if running is not None and running[0].is_alive():
+            return running[1]
+
+        stop = threading.Event()
+
+        def refresh_loop():
+            while not stop.is_set():
+                try:
+                    load_cached_valuation(cache_dir, ttl_seconds=interval_seconds, url=url, timeout=timeout)
+                except Exception as e:
+                    print(f"Valuation refresh failed: {e}")
+                stop.wait(interval_seconds)
+
+        thread = threading.Thread(target=refresh_loop, name='valuation-refresher', daemon=True)
+        thread.start()
+        _valuation_refreshers[cache_dir] = (thread, stop)
+        return stop
+
 if __name__ == "__main__":
     # Test run
     # df = load_initial_data(r'c:\D\Python\Balancetes\historical')
@@ -0,0 +1,63 @@
+"""
+Headless builder for the dashboard dataset.
+
+Runs the workbook + CSV ingestion, the KPI computation and the latest-snapshot table offline and
+publishes them as a versioned Arrow artifact that app.py memory-maps on startup, e.g. from cron
+after the Central Bank publishes a new month:
+
+    python precompute.py --data-dir /data/Balancetes
+    python precompute.py --data-dir /data/Balancetes --full-universe --workers 4
+    python precompute.py --data-dir /data/Balancetes --account-store   # also every account (query_accounts.py,
+                                                                         # data_loader.account_series)
+
+Exits with status 0 when the artifact is published or already up to date, 1 when no data was found.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import data_loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the dashboard dataset as a versioned Arrow artifact.")
+    parser.add_argument('--data-dir', required=True,
+                        help="Directory with the monthly *BANCOS.CSV files and the 'historical' workbook folder")
+    parser.add_argument('--full-universe', action='store_true', help="Ingest every institution, not only mapped banks")
+    parser.add_argument('--workers', type=int, default=None, help="Parse CSV files in this many processes")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse the materialized dataset and only ingest new CSV files")
+    parser.add_argument('--keep', type=int, default=3, help="Artifact versions to keep")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the sources did not change")
+    parser.add_argument('--account-store', action='store_true',
+                        help="Also ingest new months into the full-account store (all accounts, all institutions)")
+    parser.add_argument('--log-stages', action='store_true', help="Print one JSON line per ETL stage")
+    args = parser.parse_args()
+
+    if args.log_stages:
+        data_loader.etl_logger.addHandler(logging.StreamHandler(sys.stdout))
+        data_loader.etl_logger.setLevel(logging.INFO)
+
+    historical = os.path.join(args.data_dir, 'historical')
+    t0 = time.perf_counter()
+    manifest = data_loader.build_artifact(historical, full_universe=args.full_universe, workers=args.workers,
+                                          incremental=args.incremental, keep=args.keep, force=args.force)
+    if manifest is None:
+        return 1
+
+    if args.account_store:
+        months = data_loader.ingest_account_store(args.data_dir)
+        print(f"Account store: {months} new or changed months ingested.")
+        # Consolidated per-account time series for memory-mapped lookups (account_series)
+        data_loader.build_account_series(os.path.join(args.data_dir, data_loader.CACHE_DIR_NAME))
+
+    print(f"Artifact {manifest['version']} ({'full' if manifest['full_universe'] else 'listed'}): "
+          f"{manifest['rows']} rows, {manifest['tickers']} tickers, "
+          f"{manifest['first_date']} to {manifest['last_date']} in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Ad-hoc SQL over the full-account store (every account of every institution, one Parquet
+partition per month), run in-process with DuckDB. Build or update the store first with
+`python precompute.py --data-dir <dir> --account-store` (or --ingest here).
+
+The store is the view 'balancetes':
+    month (YYYYMM), Ticker, CNPJ, NOME_INSTITUICAO, CONTA, NOME_CONTA, SALDO
+
+Example, income taxes over pre-tax result for all banks since 2018 (semester-cumulative balances):
+
+    python query_accounts.py --data-dir /data/Balancetes "
+        SELECT month, Ticker,
+               -SUM(SALDO) FILTER (WHERE CONTA = 8940000007) AS taxes,
+               SUM(SALDO) FILTER (WHERE CONTA IN (7000000003, 8000000002))
+                 - SUM(SALDO) FILTER (WHERE CONTA = 8940000007) AS pre_tax_result,
+               taxes / NULLIF(pre_tax_result, 0) AS tax_rate
+        FROM balancetes
+        WHERE month >= 201801
+        GROUP BY ALL ORDER BY month, Ticker"
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+import data_loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the full-account balancete store with SQL (DuckDB).")
+    parser.add_argument('sql', nargs='?', help=f"SQL over the '{data_loader.ACCOUNT_STORE_VIEW}' view")
+    parser.add_argument('--data-dir', required=True, help="Directory with the monthly *BANCOS.CSV files")
+    parser.add_argument('--ingest', action='store_true', help="Ingest new or changed months before querying")
+    parser.add_argument('--output', help="Write the result to this CSV file instead of printing it")
+    args = parser.parse_args()
+
+    cache_dir = os.path.join(args.data_dir, data_loader.CACHE_DIR_NAME)
+    if args.ingest:
+        months = data_loader.ingest_account_store(args.data_dir, cache_dir)
+        print(f"Account store: {months} new or changed months ingested.")
+    if not args.sql:
+        return 0
+
+    t0 = time.perf_counter()
+    result = data_loader.query_account_store(args.sql, cache_dir)
+    elapsed = time.perf_counter() - t0
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+    else:
+        with pd.option_context('display.max_rows', 50, 'display.width', 200):
+            print(result)
+    print(f"{len(result)} rows in {elapsed:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Incremental loads must end up with the same dataset as a full load of the same files.
+
+Runs on a small synthetic data directory (benchmark.generate_dataset):
+
+    python -m pytest -q test_incremental.py
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+import benchmark
+import data_loader
+
+COLUMNS = ['Ticker', 'Date', 'MonthlyProfit', 'Equity'] + data_loader.KPI_COLUMNS
+
+
+@contextlib.contextmanager
+def synthetic_dir(months=20, excel_months=6):
+    root_dir = tempfile.mkdtemp(prefix='balancetes_test_')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            benchmark.generate_dataset(root_dir, months=months, excel_months=excel_months, institutions=25, accounts=5)
+        yield root_dir
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def full_load(root_dir):
+    # Fresh directory copy without caches, so nothing materialized is reused
+    copy_dir = tempfile.mkdtemp(prefix='balancetes_full_')
+    try:
+        for name in os.listdir(root_dir):
+            if name != data_loader.CACHE_DIR_NAME:
+                src = os.path.join(root_dir, name)
+                (shutil.copytree if os.path.isdir(src) else shutil.copy2)(src, os.path.join(copy_dir, name))
+        return quiet(data_loader.load_initial_data, os.path.join(copy_dir, 'historical'), use_cache=False)
+    finally:
+        shutil.rmtree(copy_dir, ignore_errors=True)
+
+
+def assert_same_dataset(actual, expected):
+    actual = actual[COLUMNS].sort_values(['Ticker', 'Date']).reset_index(drop=True)
+    expected = expected[COLUMNS].sort_values(['Ticker', 'Date']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+def month_file(root_dir, yyyymm):
+    return os.path.join(root_dir, f"{yyyymm}BANCOS.CSV")
+
+
+def revise_account(path, account, factor):
+    # Re-publishes a monthly CSV with one account's balances scaled (keeps the 3-line preamble)
+    with open(path, 'r', encoding='latin1') as f:
+        preamble = [next(f) for _ in range(3)]
+    df = pd.read_csv(path, sep=';', encoding='latin1', skiprows=3, dtype=str, keep_default_na=False)
+    rows = df['CONTA'] == str(account)
+    values = df.loc[rows, 'SALDO'].str.replace(',', '.').astype(float) * factor
+    df.loc[rows, 'SALDO'] = values.map(lambda v: f"{v:.2f}".replace('.', ','))
+    with open(path, 'w', encoding='latin1', newline='') as f:
+        f.writelines(preamble)
+        df.to_csv(f, sep=';', index=False, lineterminator='\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_incremental_append_matches_full_load():
+    with synthetic_dir() as root_dir:
+        historical = os.path.join(root_dir, 'historical')
+        held = month_file(root_dir, '201608')
+        shutil.move(held, held + '.held')
+        quiet(data_loader.load_initial_data, historical, incremental=True)
+        shutil.move(held + '.held', held)
+
+        df = quiet(data_loader.load_initial_data, historical, incremental=True)
+        assert_same_dataset(df, full_load(root_dir))
+
+
+def test_late_month_rederives_its_semester():
+    with synthetic_dir() as root_dir:
+        historical = os.path.join(root_dir, 'historical')
+        late = month_file(root_dir, '201602')
+        shutil.move(late, late + '.held')
+        quiet(data_loader.load_initial_data, historical, incremental=True)
+        shutil.move(late + '.held', late)
+
+        df = quiet(data_loader.load_initial_data, historical, incremental=True)
+        assert_same_dataset(df, full_load(root_dir))
+
+
+def test_revised_month_replaces_its_rows():
+    with synthetic_dir() as root_dir:
+        historical = os.path.join(root_dir, 'historical')
+        quiet(data_loader.load_initial_data, historical, incremental=True)
+
+        # Mid-semester revision: changes that month and the following month's profit
+        revise_account(month_file(root_dir, '201604'), data_loader.ACCOUNT_INCOME, 1.5)
+        revise_account(month_file(root_dir, '201608'), data_loader.ACCOUNT_EQUITY, 0.5)
+
+        df = quiet(data_loader.load_initial_data, historical, incremental=True)
+        assert_same_dataset(df, full_load(root_dir))
+        assert quiet(data_loader.load_initial_data, historical, incremental=True).equals(df)
+
+
+def test_backfill_retries_failed_and_revised_months():
+    with synthetic_dir() as root_dir:
+        historical = os.path.join(root_dir, 'historical')
+        broken = month_file(root_dir, '201602')
+        shutil.copy2(broken, broken + '.orig')
+        with open(broken, 'w', encoding='latin1') as f:
+            f.write("corrupted\n")
+
+        summary = quiet(data_loader.backfill_history, historical)
+        assert summary['failed'] == [os.path.basename(broken)]
+
+        os.replace(broken + '.orig', broken)
+        revise_account(month_file(root_dir, '201605'), data_loader.ACCOUNT_INCOME, 0.8)
+        summary = quiet(data_loader.backfill_history, historical)
+        assert summary['months'] == 2 and not summary['failed']
+
+        cache_dir = os.path.join(root_dir, data_loader.CACHE_DIR_NAME)
+        df = quiet(data_loader.load_materialized_dataset, cache_dir, data_loader._signature(
+            os.path.join(historical, 'Balancetes_por_ticker.xlsx')))[0]
+        assert_same_dataset(df, full_load(root_dir))
+
+
+def test_universe_modes_keep_their_own_checkpoint():
+    with synthetic_dir() as root_dir:
+        historical = os.path.join(root_dir, 'historical')
+        for full_universe in (False, True):
+            quiet(data_loader.load_initial_data, historical, incremental=True, full_universe=full_universe)
+
+        for full_universe in (False, True):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                data_loader.load_initial_data(historical, incremental=True, full_universe=full_universe)
+            assert "Materialized dataset is up to date" in out.getvalue()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")